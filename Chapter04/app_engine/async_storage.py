@@ -0,0 +1,198 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Non-blocking access to the resume templates stored in Cloud Storage.
+
+The Cloud Storage client library only offers blocking calls, so templates
+are read here with the JSON API over an asynchronous HTTP client. The
+number of concurrent calls to Cloud Storage is limited, and concurrent
+requests for the same template share a single fetch.
+
+Like the client library, the STORAGE_EMULATOR_HOST environment variable
+can point the client to a local fake GCS, which needs no credentials.
+"""
+import asyncio
+import functools
+import logging
+import os
+import time
+import urllib.parse
+
+import google.auth
+import google.auth.transport.requests
+import httpx
+
+from resume_template import CompiledTemplate
+from template_cache import CachedTemplate, TemplateCache, TemplateNotFound
+
+STORAGE_ENDPOINT = "https://storage.googleapis.com"
+READ_ONLY_SCOPE = "https://www.googleapis.com/auth/devstorage.read_only"
+
+
+def run_in_thread(function, *args, **kwargs):
+  """Runs a blocking function in the default executor of the event loop.
+  Same as asyncio.to_thread, which is not available in Python 3.8.
+  """
+  return asyncio.get_running_loop().run_in_executor(
+      None, functools.partial(function, *args, **kwargs))
+
+
+class AsyncStorageClient(object):
+  """Minimal asynchronous client to read objects from Cloud Storage."""
+
+  def __init__(self, max_concurrency=32, timeout=30):
+    """Creates a new client.
+    Args:
+        max_concurrency (int): Maximum number of concurrent storage calls.
+        timeout (float): Seconds before a storage call times out.
+    """
+    emulator_host = os.getenv("STORAGE_EMULATOR_HOST")
+    if emulator_host and "://" not in emulator_host:
+      emulator_host = "http://" + emulator_host
+    self._endpoint = (emulator_host or STORAGE_ENDPOINT).rstrip("/")
+    self._anonymous = bool(emulator_host)
+    self._credentials = None
+    self._max_concurrency = max_concurrency
+    # Created on first use, so they belong to the event loop of the server
+    self._auth_lock = None
+    self._semaphore = None
+    self._http = httpx.AsyncClient(
+        timeout=timeout,
+        limits=httpx.Limits(max_connections=max_concurrency))
+
+  async def _auth_headers(self):
+    headers = {}
+    if self._anonymous:
+      return headers
+    async with self._auth_lock:
+      # Finding and refreshing credentials blocks, so do it in a thread
+      if self._credentials is None:
+        self._credentials, _ = await run_in_thread(
+            google.auth.default, scopes=[READ_ONLY_SCOPE])
+      if not self._credentials.valid:
+        await run_in_thread(
+            self._credentials.refresh,
+            google.auth.transport.requests.Request())
+    self._credentials.apply(headers)
+    return headers
+
+  async def _get(self, bucket_name, object_name, params):
+    if self._semaphore is None:
+      self._auth_lock = asyncio.Lock()
+      self._semaphore = asyncio.Semaphore(self._max_concurrency)
+    url = "{}/storage/v1/b/{}/o/{}".format(
+        self._endpoint, urllib.parse.quote(bucket_name, safe=""),
+        urllib.parse.quote(object_name, safe=""))
+    async with self._semaphore:
+      response = await self._http.get(
+          url, params=params, headers=await self._auth_headers())
+    if response.status_code == 404:
+      raise TemplateNotFound(object_name)
+    response.raise_for_status()
+    return response
+
+  async def get_generation(self, bucket_name, object_name):
+    """Returns the current generation of an object.
+    Raises:
+        TemplateNotFound: if the object does not exist.
+    """
+    response = await self._get(
+        bucket_name, object_name, {"fields": "generation"})
+    return int(response.json()["generation"])
+
+  async def download(self, bucket_name, object_name, generation):
+    """Returns the content of a generation of an object.
+    Raises:
+        TemplateNotFound: if the object does not exist.
+    """
+    response = await self._get(
+        bucket_name, object_name,
+        {"alt": "media", "generation": str(generation)})
+    return response.content
+
+  async def aclose(self):
+    await self._http.aclose()
+
+
+class AsyncTemplateCache(TemplateCache):
+  """TemplateCache whose lookups never block the event loop."""
+
+  def __init__(self, bucket_name, async_client, check_interval=30,
+               max_bytes=16 * 1024 * 1024, on_change=None,
+               precompress=False):
+    """Creates a new cache.
+    Args:
+        bucket_name (string): Name of the bucket storing the templates.
+        async_client (AsyncStorageClient): Client to read the templates.
+        check_interval (float): Seconds between generation checks.
+        max_bytes (int): Maximum total size of the cached templates.
+        on_change (callable): Called with the template name when a cached
+            template is replaced by a new generation or invalidated.
+        precompress (bool): Whether to precompress the compiled templates.
+    """
+    super().__init__(bucket_name, check_interval, max_bytes,
+                     on_change=on_change, precompress=precompress)
+    self.async_client = async_client
+    self._pending = {}
+
+  async def get(self, template):
+    return (await self.lookup(template)).html
+
+  async def get_compiled(self, template):
+    return (await self.lookup(template)).compiled
+
+  async def lookup(self, template):
+    """Returns the cached entry of a template, downloading it if needed.
+    Args:
+        template (string): File name of the template to use.
+    Returns:
+        CachedTemplate with the raw HTML, compiled template and generation.
+    Raises:
+        TemplateNotFound: if the template does not exist.
+    """
+    now = time.monotonic()
+    entry, fresh = self._cached_entry(template, now)
+    if fresh:
+      return entry
+
+    # Requests arriving while the template is fetched wait for that fetch
+    fetch = self._pending.get(template)
+    if fetch is None:
+      fetch = asyncio.ensure_future(self._refresh(template, entry, now))
+      self._pending[template] = fetch
+      fetch.add_done_callback(lambda _: self._pending.pop(template, None))
+    return await asyncio.shield(fetch)
+
+  async def _refresh(self, template, entry, now):
+    generation = await self.async_client.get_generation(
+        self.bucket_name, template)
+    if entry is not None and entry.generation == generation:
+      entry = entry._replace(checked_at=now)
+      self._store(template, entry)
+      return entry
+
+    logging.info("Loading template file %s (generation %s).",
+                 template, generation)
+    content = await self.async_client.download(
+        self.bucket_name, template, generation)
+    html = content.decode("utf-8")
+    # Compiling may compress the template, so keep it off the event loop
+    compiled = await run_in_thread(
+        CompiledTemplate, html, self.precompress)
+    changed = entry is not None
+    entry = CachedTemplate(html, compiled, generation,
+                           len(content) + compiled.size, now)
+    self._store(template, entry)
+    if changed and self.on_change is not None:
+      self.on_change(template)
+    return entry
@@ -0,0 +1,29 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Settings read by gunicorn from the working directory when it starts.
+
+The default App Engine entrypoint, gunicorn -b :$PORT main:app, runs
+main.py with them.
+"""
+import sys
+
+
+def post_worker_init(worker):
+  """Starts loading the templates once a worker has loaded main.py.
+  Workers running main_async.py, which imports main.py for its helpers,
+  start the refresher of their own cache at lifespan startup instead.
+  """
+  main = sys.modules.get("main")
+  if main is not None and worker.wsgi is main.app:
+    main.start_background_refresh()
@@ -14,16 +14,50 @@
 # limitations under the License.
 
 
-from flask import request, current_app, Flask
-from google.cloud import storage
+from flask import request, abort, g, jsonify, Flask, Response
 import google.cloud.logging
 import logging
+import os
+import time
+
+import resume_batch
+from request_timing import NULL_TIMER, RequestTimer, StageStats
+from response_cache import ResponseCache, resume_etag
+from template_cache import TemplateCache, TemplateNotFound
 
 # Name of the bucket storing the template files
 # Please replace this with your own random name
 BUCKET_NAME = "resume_xew878w6e"
 DEFAULT_TEMPLATE_NAME = "english.html"
 
+# Seconds between checks for new versions of a cached template, and maximum
+# number of bytes used to keep templates in memory
+TEMPLATE_CHECK_INTERVAL = float(os.getenv("TEMPLATE_CHECK_INTERVAL", "30"))
+TEMPLATE_CACHE_BYTES = int(os.getenv("TEMPLATE_CACHE_BYTES", "16777216"))
+
+# Set to "false" to load templates only when requested. Otherwise all the
+# templates in the bucket are loaded when the instance starts, and the
+# bucket is listed again every TEMPLATE_REFRESH_INTERVAL seconds to load
+# the new or changed ones in the background
+PREWARM_TEMPLATES = os.getenv("PREWARM_TEMPLATES", "true") == "true"
+TEMPLATE_REFRESH_INTERVAL = float(
+    os.getenv("TEMPLATE_REFRESH_INTERVAL", "60"))
+
+# Set to "false" to log to the console only, for example when running
+# offline against a local fake GCS
+CLOUD_LOGGING = os.getenv("CLOUD_LOGGING", "true") == "true"
+
+# Maximum number of bytes used to keep personalized resumes in memory
+RESPONSE_CACHE_BYTES = int(os.getenv("RESPONSE_CACHE_BYTES", "8388608"))
+
+# Set to "true" to compress templates once when they are loaded, and send
+# compressed resumes to the clients that accept them
+PRECOMPRESS_TEMPLATES = os.getenv("PRECOMPRESS_TEMPLATES", "false") == "true"
+
+# Set to "false" to stop logging the stage timings of each request. They are
+# still sent in the Server-Timing header and kept in the /stats histograms
+LOG_REQUEST_TIMINGS = os.getenv("LOG_REQUEST_TIMINGS", "true") == "true"
+
 app = Flask(__name__)
 app.debug = False
 app.testing = False
@@ -31,32 +65,37 @@ app.testing = False
 # Configure logging
 if not app.testing:
     logging.basicConfig(level=logging.INFO)
-    client = google.cloud.logging.Client()
-    # Attaches a Cloud Logging handler to the root logger
-    client.setup_logging()
+    if CLOUD_LOGGING:
+        client = google.cloud.logging.Client()
+        # Attaches a Cloud Logging handler to the root logger
+        client.setup_logging()
+
+response_cache = ResponseCache(RESPONSE_CACHE_BYTES)
+template_cache = TemplateCache(
+    BUCKET_NAME, TEMPLATE_CHECK_INTERVAL, TEMPLATE_CACHE_BYTES,
+    on_change=response_cache.invalidate_template,
+    precompress=PRECOMPRESS_TEMPLATES)
+stage_stats = StageStats()
+
+def start_background_refresh():
+  """Starts loading the templates in the background, if PREWARM_TEMPLATES.
+  Called by gunicorn once a worker has loaded the app, see gunicorn.conf.py,
+  so the templates load without waiting for a warmup request or traffic.
+  Does nothing if the refresher is already running.
+  """
+  if PREWARM_TEMPLATES:
+    template_cache.start_refresher(TEMPLATE_REFRESH_INTERVAL)
 
 def load_resume(template):
   """Loads the raw HTML of the resume from a predefined file.
+  Templates are cached in memory and only downloaded again from the bucket
+  when a new version of the file is uploaded.
   Args:
       template (string): File name of the template to use.  
   Returns:
       Full raw HTML of the resume.
   """
-
-  # Instantiate a Cloud Storage client
-  storage_client = storage.Client()
-  
-  # Open the bucket
-  bucket = storage_client.bucket(BUCKET_NAME)
-  
-  # And get to the blob containing our HTML template
-  blob = bucket.blob(template)
-  
-  # Open the blob and return its contents
-  with blob.open("r") as resume_file:
-    current_app.logger.info(
-        'Loading template file %s.', template)
-    return(resume_file.read())
+  return template_cache.get(template)
 
 def build_resume_header(name, company):
   """Builds the customized header for the resume.
@@ -89,6 +128,83 @@ def replace_resume_header(resume_html, header_text):
   """
   return resume_html.replace("##RESUME_HEAD##", header_text)
 
+def load_compiled_resume(template):
+  """Loads the resume template, already split around its header.
+  Args:
+      template (string): File name of the template to use.
+  Returns:
+      CompiledTemplate for the resume.
+  """
+  return template_cache.get_compiled(template)
+
+def render_resume(cached_template, template, name, company,
+                  accept_encodings, if_none_match, timer=NULL_TIMER):
+  """Renders a resume from a cached template, using cached copies if possible.
+  Args:
+      cached_template (CachedTemplate): Template of the resume.
+      template (string): File name of the template to use.
+      name (string): Name of the person receiving the resume.
+      company (string): Company receiving the resume.
+      accept_encodings (werkzeug.datastructures.Accept): Content codings
+          accepted by the client.
+      if_none_match (werkzeug.datastructures.ETags): ETags the client has.
+      timer (RequestTimer): Timer of the header and render stages.
+  Returns:
+      The body of the resume as bytes or an iterator over byte chunks, or
+      None if the client already has it, the content coding of the body, or
+      None if it is not compressed, and the ETag of the resume.
+  """
+  compiled_resume = cached_template.compiled
+  generation = cached_template.generation
+  with timer.stage("header"):
+    resume_header = build_resume_header(name, company)
+  with timer.stage("render"):
+    etag = resume_etag(template, generation, resume_header)
+    # Precompressed resumes have their own ETag, as their content is different
+    encoding = accept_encodings.best_match(
+        compiled_resume.encodings(resume_header))
+    if encoding:
+      etag = etag + "-" + encoding
+    if if_none_match.contains(etag):
+      return None, encoding, etag
+    if encoding:
+      return (compiled_resume.render_encoded(resume_header, encoding),
+              encoding, etag)
+    resume_bytes = response_cache.get(template, generation, name, company)
+    if resume_bytes is None:
+      if compiled_resume.size > response_cache.max_bytes:
+        return compiled_resume.render(resume_header), None, etag
+      resume_bytes = compiled_resume.render_bytes(resume_header)
+      response_cache.put(template, generation, name, company, resume_bytes)
+    return resume_bytes, None, etag
+
+def resume_response(request, template, name, company):
+  """Builds the HTTP response with the resume, using cached copies if possible.
+  Args:
+      request (flask.Request): The request object.
+      template (string): File name of the template to use.
+      name (string): Name of the person receiving the resume.
+      company (string): Company receiving the resume.
+  Returns:
+      The response, which is a 304 if the client already has this resume.
+  """
+  timer = g.get("timer", NULL_TIMER)
+  with timer.stage("fetch"):
+    cached_template = template_cache.lookup(template)
+  body, encoding, etag = render_resume(
+      cached_template, template, name, company,
+      request.accept_encodings, request.if_none_match, timer)
+  if body is None:
+    response = Response(status=304)
+  else:
+    response = Response(body, mimetype="text/html")
+    if encoding:
+      response.content_encoding = encoding
+  response.set_etag(etag)
+  if cached_template.compiled.precompressed:
+    response.vary.add("Accept-Encoding")
+  return response
+
 def return_resume(template, name, company):
   """Loads the resume, replaces the header and returns it.
   Args:
@@ -103,6 +219,60 @@ def return_resume(template, name, company):
   resume_html = replace_resume_header(resume_html, resume_header)
   return resume_html
 
+@app.before_request
+def start_request_timer():
+  g.timer = RequestTimer()
+
+@app.route('/_ah/warmup')
+def warmup():
+  """Loads all the templates before the instance receives traffic.
+  """
+  if PREWARM_TEMPLATES:
+    start_background_refresh()
+    template_cache.wait_until_listed(timeout=60)
+  return ''
+
+def record_request_timings(timer, endpoint, template, status):
+  """Adds the timings of a request to the histograms, and logs them.
+  Args:
+      timer (RequestTimer): Timer of the request, once its body is written.
+      endpoint (string): Name of the endpoint serving the request.
+      template (string): File name of the template requested.
+      status (int): HTTP status code of the response.
+  """
+  timer.add("total", timer.elapsed())
+  stage_stats.record(endpoint, timer.stages)
+  if LOG_REQUEST_TIMINGS:
+    # Shown as structured fields of the entry in Cloud Logging
+    logging.info("Served %s in %.1f ms", endpoint,
+                 timer.stages["total"] * 1000, extra={"json_fields": {
+                     "endpoint": endpoint,
+                     "template": template,
+                     "status": status,
+                     "stages_ms": {name: round(seconds * 1000, 3)
+                                   for name, seconds
+                                   in timer.stages.items()},
+                 }})
+
+@app.after_request
+def finish_request_timer(response):
+  """Sends the stage timings, and records them once the body is written.
+  """
+  timer = g.get("timer")
+  if timer is None or request.endpoint in (None, "stats"):
+    return response
+  response.headers["Server-Timing"] = timer.server_timing()
+  endpoint = request.endpoint
+  template = request.args.get("template", DEFAULT_TEMPLATE_NAME)
+  write_start = time.perf_counter()
+
+  def record_timings():
+    timer.add("write", time.perf_counter() - write_start)
+    record_request_timings(timer, endpoint, template, response.status_code)
+
+  response.call_on_close(record_timings)
+  return response
+
 @app.route('/')
 def get():
   """Receives the GET request and returns the resume in HTML format.
@@ -110,10 +280,61 @@ def get():
   template = request.args.get('template', DEFAULT_TEMPLATE_NAME)
   name = request.args.get('name', None)
   company = request.args.get('company', None)
-  resume_html = return_resume(template, name, company)
-  return resume_html
+  try:
+    return resume_response(request, template, name, company)
+  except TemplateNotFound:
+    abort(404, 'Template {} not found'.format(template))
+
+@app.route('/stats')
+def stats():
+  """Returns the latency histograms of each stage, and the cache usage.
+  """
+  return jsonify({
+      "stages": stage_stats.to_dict(),
+      "response_cache": response_cache.stats(),
+  })
+
+@app.route('/batch', methods=['POST'])
+def batch():
+  """Receives a list of recipients and returns all their resumes.
+  The body is a JSON array, NDJSON or CSV with (name, company) pairs, and
+  the resumes are streamed back as NDJSON, or as a zip archive if the
+  format query argument is "zip".
+  Errors in the first recipient are answered with a 400. As the response
+  is already being sent when a later recipient can't be parsed, the error
+  is then reported in a last NDJSON line, or in an ERROR.txt file at the
+  end of the zip archive.
+  """
+  template = request.args.get('template', DEFAULT_TEMPLATE_NAME)
+  output_format = request.args.get('format', 'ndjson')
+  if output_format not in ('ndjson', 'zip'):
+    abort(400, 'Unknown output format')
+  # Load the template once for all recipients
+  try:
+    compiled_resume = load_compiled_resume(template)
+  except TemplateNotFound:
+    abort(404, 'Template {} not found'.format(template))
+  try:
+    recipients = resume_batch.check_first(
+        resume_batch.read_recipients(request))
+  except resume_batch.BatchError as error:
+    abort(400, str(error))
+
+  if output_format == 'zip':
+    response = Response(
+        resume_batch.render_zip(
+            compiled_resume, recipients, build_resume_header),
+        mimetype='application/zip')
+    response.headers['Content-Disposition'] = (
+        'attachment; filename="resumes.zip"')
+    return response
+  return Response(
+      resume_batch.render_ndjson(
+          compiled_resume, recipients, build_resume_header),
+      mimetype='application/x-ndjson')
 
 # This is only used when running locally. When running live, gunicorn runs
 # the application.
 if __name__ == '__main__':
+  start_background_refresh()
   app.run(host='127.0.0.1', port=8080, debug=True)
\ No newline at end of file
@@ -0,0 +1,295 @@
+#!/usr/bin/env python
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Asynchronous (ASGI) version of the resume service.
+
+Serves the same routes and output as main.py, but templates are read from
+Cloud Storage with non-blocking I/O, so a single instance can keep hundreds
+of requests in flight while storage is slow. Requests beyond
+MAX_IN_FLIGHT_REQUESTS get a 503, and at most STORAGE_MAX_CONCURRENCY
+calls to Cloud Storage run at the same time.
+
+To use it on App Engine, set this entrypoint in app.yaml:
+
+  entrypoint: gunicorn -b :$PORT -k uvicorn.workers.UvicornWorker main_async:app
+
+or run it locally with: uvicorn main_async:app --port 8080
+"""
+import io
+import json
+import logging
+import os
+import time
+import urllib.parse
+
+from werkzeug.http import parse_accept_header, parse_etags, quote_etag
+
+import main
+import resume_batch
+from async_storage import AsyncStorageClient, AsyncTemplateCache
+from async_storage import TemplateNotFound, run_in_thread
+from request_timing import RequestTimer
+
+# Maximum number of requests being served at the same time
+MAX_IN_FLIGHT_REQUESTS = int(os.getenv("MAX_IN_FLIGHT_REQUESTS", "500"))
+
+# Maximum number of concurrent calls to Cloud Storage
+STORAGE_MAX_CONCURRENCY = int(os.getenv("STORAGE_MAX_CONCURRENCY", "32"))
+
+# Maximum size of the body of a batch request. Unlike in main.py, the body
+# is read in full before parsing it
+MAX_BATCH_BYTES = int(os.getenv("MAX_BATCH_BYTES", "10485760"))
+
+storage_client = AsyncStorageClient(STORAGE_MAX_CONCURRENCY)
+template_cache = AsyncTemplateCache(
+    main.BUCKET_NAME, storage_client, main.TEMPLATE_CHECK_INTERVAL,
+    main.TEMPLATE_CACHE_BYTES,
+    on_change=main.response_cache.invalidate_template,
+    precompress=main.PRECOMPRESS_TEMPLATES)
+
+in_flight_requests = 0
+
+
+class HTTPError(Exception):
+  """Ends the request with an HTTP error status."""
+
+  def __init__(self, status, message):
+    super().__init__(message)
+    self.status = status
+
+
+async def send_response(send, status, headers, body):
+  """Sends a full response.
+  Args:
+      send (callable): ASGI send channel.
+      status (int): HTTP status code.
+      headers (list): (name, value) string tuples.
+      body (bytes or iterable): Body, or iterator over the body chunks.
+  """
+  headers = [(name.lower().encode("latin-1"), value.encode("latin-1"))
+             for name, value in headers]
+  if isinstance(body, bytes):
+    headers.append((b"content-length", str(len(body)).encode("latin-1")))
+    body = [body]
+  await send({"type": "http.response.start", "status": status,
+              "headers": headers})
+  for chunk in body:
+    if chunk:
+      await send({"type": "http.response.body", "body": chunk,
+                  "more_body": True})
+  await send({"type": "http.response.body", "body": b""})
+
+
+def with_timings(send, timer, endpoint, template):
+  """Wraps an ASGI send channel to send and record the stage timings.
+  Like main.finish_request_timer, the timings so far are sent in a
+  Server-Timing header, and recorded once the body is written.
+  """
+  response = {}
+  async def send_timed(message):
+    if message["type"] == "http.response.start":
+      response["status"] = message["status"]
+      response["write_start"] = time.perf_counter()
+      message = dict(message, headers=list(message["headers"]) + [
+          (b"server-timing", timer.server_timing().encode("latin-1"))])
+    await send(message)
+    if (message["type"] == "http.response.body"
+        and not message.get("more_body", False)):
+      timer.add("write", time.perf_counter() - response["write_start"])
+      main.record_request_timings(
+          timer, endpoint, template, response["status"])
+  return send_timed
+
+
+def without_body(send):
+  """Wraps an ASGI send channel to drop the body, for HEAD requests."""
+  async def send_headers(message):
+    if message["type"] == "http.response.body":
+      message = {"type": "http.response.body", "body": b"",
+                 "more_body": message.get("more_body", False)}
+    await send(message)
+  return send_headers
+
+
+async def read_body(receive, max_bytes):
+  """Returns the body of the request, up to max_bytes."""
+  chunks = []
+  size = 0
+  more_body = True
+  while more_body:
+    message = await receive()
+    chunk = message.get("body", b"")
+    size += len(chunk)
+    if size > max_bytes:
+      raise HTTPError(413, "Request body too large")
+    chunks.append(chunk)
+    more_body = message.get("more_body", False)
+  return b"".join(chunks)
+
+
+async def get(args, headers, send, timer):
+  """Receives the GET request and returns the resume in HTML format.
+  """
+  template = args.get('template', main.DEFAULT_TEMPLATE_NAME)
+  name = args.get('name', None)
+  company = args.get('company', None)
+  with timer.stage("fetch"):
+    cached_template = await template_cache.lookup(template)
+  body, encoding, etag = main.render_resume(
+      cached_template, template, name, company,
+      parse_accept_header(headers.get("accept-encoding")),
+      parse_etags(headers.get("if-none-match")), timer)
+  response_headers = [("ETag", quote_etag(etag))]
+  if cached_template.compiled.precompressed:
+    response_headers.append(("Vary", "Accept-Encoding"))
+  if body is None:
+    await send_response(send, 304, response_headers, b"")
+    return
+  response_headers.append(("Content-Type", "text/html; charset=utf-8"))
+  if encoding:
+    response_headers.append(("Content-Encoding", encoding))
+  await send_response(send, 200, response_headers, body)
+
+
+async def batch(args, headers, receive, send):
+  """Receives a list of recipients and returns all their resumes.
+  """
+  template = args.get('template', main.DEFAULT_TEMPLATE_NAME)
+  output_format = args.get('format', 'ndjson')
+  if output_format not in ('ndjson', 'zip'):
+    raise HTTPError(400, 'Unknown output format')
+  compiled_resume = (await template_cache.lookup(template)).compiled
+  body = await read_body(receive, MAX_BATCH_BYTES)
+  mimetype = headers.get("content-type", "").split(";")[0].strip().lower()
+  try:
+    recipients = resume_batch.check_first(
+        resume_batch.parse_recipients(mimetype, io.BytesIO(body)))
+  except resume_batch.BatchError as error:
+    raise HTTPError(400, str(error))
+
+  if output_format == 'zip':
+    await send_response(
+        send, 200,
+        [("Content-Type", "application/zip"),
+         ("Content-Disposition", 'attachment; filename="resumes.zip"')],
+        resume_batch.render_zip(
+            compiled_resume, recipients, main.build_resume_header))
+  else:
+    await send_response(
+        send, 200, [("Content-Type", "application/x-ndjson")],
+        resume_batch.render_ndjson(
+            compiled_resume, recipients, main.build_resume_header))
+
+
+async def stats(send):
+  """Returns the latency histograms of each stage, and the cache usage.
+  """
+  body = json.dumps({
+      "stages": main.stage_stats.to_dict(),
+      "response_cache": main.response_cache.stats(),
+  }).encode("utf-8")
+  await send_response(send, 200, [("Content-Type", "application/json")], body)
+
+
+async def warmup(send):
+  """Loads all the templates before the instance receives traffic.
+  """
+  if main.PREWARM_TEMPLATES:
+    # The refresher lists the bucket in a thread, wait for it in another
+    await run_in_thread(template_cache.wait_until_listed, timeout=60)
+  await send_response(send, 200, [("Content-Type", "text/html")], b"")
+
+
+async def handle(scope, receive, send):
+  """Routes a request to its handler, turning errors into responses."""
+  # Like Flask's request.args, keep the first value of each argument
+  args = {}
+  for key, value in urllib.parse.parse_qsl(
+      scope["query_string"].decode("latin-1"), keep_blank_values=True):
+    args.setdefault(key, value)
+  headers = {name.decode("latin-1"): value.decode("latin-1")
+             for name, value in scope["headers"]}
+  path, method = scope["path"], scope["method"]
+  if method == "HEAD":
+    send = without_body(send)
+  # Endpoint names as in main.py
+  endpoint = {"/": "get", "/batch": "batch"}.get(path)
+  timer = RequestTimer()
+  if endpoint:
+    send = with_timings(send, timer, endpoint,
+                        args.get("template", main.DEFAULT_TEMPLATE_NAME))
+  try:
+    if path == "/" and method in ("GET", "HEAD"):
+      await get(args, headers, send, timer)
+    elif path == "/batch" and method == "POST":
+      await batch(args, headers, receive, send)
+    elif path == "/stats" and method in ("GET", "HEAD"):
+      await stats(send)
+    elif path == "/_ah/warmup" and method in ("GET", "HEAD"):
+      await warmup(send)
+    elif path in ("/", "/batch", "/stats", "/_ah/warmup"):
+      raise HTTPError(405, "Method Not Allowed")
+    else:
+      raise HTTPError(404, "Not Found")
+  except TemplateNotFound as error:
+    await send_response(
+        send, 404, [("Content-Type", "text/plain")],
+        "Template {} not found".format(error).encode("utf-8"))
+  except HTTPError as error:
+    await send_response(
+        send, error.status, [("Content-Type", "text/plain")],
+        str(error).encode("utf-8"))
+
+
+async def lifespan(receive, send):
+  while True:
+    message = await receive()
+    if message["type"] == "lifespan.startup":
+      if main.PREWARM_TEMPLATES:
+        # Lists the bucket with the blocking client, in its own thread
+        template_cache.start_refresher(main.TEMPLATE_REFRESH_INTERVAL)
+      await send({"type": "lifespan.startup.complete"})
+    elif message["type"] == "lifespan.shutdown":
+      template_cache.stop_refresher()
+      await storage_client.aclose()
+      await send({"type": "lifespan.shutdown.complete"})
+      return
+
+
+async def app(scope, receive, send):
+  """ASGI entry point of the resume service."""
+  global in_flight_requests
+  if scope["type"] == "lifespan":
+    await lifespan(receive, send)
+    return
+  if scope["type"] != "http":
+    return
+  if in_flight_requests >= MAX_IN_FLIGHT_REQUESTS:
+    logging.warning("Too many requests in flight, rejecting request.")
+    await send_response(
+        send, 503, [("Content-Type", "text/plain"), ("Retry-After", "1")],
+        b"Service Unavailable")
+    return
+  # All requests run in the same event loop, so no lock is needed
+  in_flight_requests += 1
+  try:
+    await handle(scope, receive, send)
+  finally:
+    in_flight_requests -= 1
+
+
+# This is only used when running locally.
+if __name__ == '__main__':
+  import uvicorn
+  uvicorn.run(app, host='127.0.0.1', port=8080)
@@ -0,0 +1,161 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Per-stage latency of requests.
+
+A RequestTimer measures the stages of one request, which are sent back in
+a Server-Timing header and added to in-process latency histograms. Timing
+a stage costs two perf_counter() calls, and histograms are only updated
+once per request, so this can stay enabled in production.
+"""
+import bisect
+import threading
+import time
+
+# Upper bounds of the histogram buckets, in milliseconds
+BUCKET_BOUNDS_MS = (0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 25, 50, 100, 250,
+                    500, 1000, 2500, 5000, 10000)
+
+
+class RequestTimer(object):
+  """Measures the time spent in each stage of a request.
+
+  Usage:
+    timer = RequestTimer()
+    with timer.stage("fetch"):
+      ...
+  """
+
+  def __init__(self):
+    self.start = time.perf_counter()
+    self.stages = {}
+    self._stage = None
+    self._stage_start = 0.0
+
+  def stage(self, name):
+    """Returns a context manager timing a stage. Stages can't be nested."""
+    self._stage = name
+    return self
+
+  def __enter__(self):
+    self._stage_start = time.perf_counter()
+    return self
+
+  def __exit__(self, *exc_info):
+    self.add(self._stage, time.perf_counter() - self._stage_start)
+
+  def add(self, name, seconds):
+    """Adds time to a stage, which is created if needed."""
+    self.stages[name] = self.stages.get(name, 0.0) + seconds
+
+  def elapsed(self):
+    """Returns the seconds since the timer was created."""
+    return time.perf_counter() - self.start
+
+  def server_timing(self, total_name="app"):
+    """Returns the value of a Server-Timing header with all the stages.
+    Args:
+        total_name (string): Name of the metric with the total time so far.
+    Returns:
+        The header value, with durations in milliseconds.
+    """
+    metrics = ["{};dur={:.3f}".format(name, seconds * 1000)
+               for name, seconds in self.stages.items()]
+    metrics.append("{};dur={:.3f}".format(total_name, self.elapsed() * 1000))
+    return ", ".join(metrics)
+
+
+class _NullTimer(object):
+  """Timer that measures nothing, for calls made outside of a request."""
+
+  def stage(self, name):
+    return self
+
+  def __enter__(self):
+    return self
+
+  def __exit__(self, *exc_info):
+    pass
+
+  def add(self, name, seconds):
+    pass
+
+
+NULL_TIMER = _NullTimer()
+
+
+class LatencyHistogram(object):
+  """Histogram of latencies, with fixed buckets. Not thread-safe."""
+
+  def __init__(self):
+    self.counts = [0] * (len(BUCKET_BOUNDS_MS) + 1)
+    self.count = 0
+    self.total_ms = 0.0
+    self.max_ms = 0.0
+
+  def observe(self, milliseconds):
+    self.counts[bisect.bisect_left(BUCKET_BOUNDS_MS, milliseconds)] += 1
+    self.count += 1
+    self.total_ms += milliseconds
+    self.max_ms = max(self.max_ms, milliseconds)
+
+  def percentile(self, fraction):
+    """Returns the upper bound of the bucket holding a percentile."""
+    rank = fraction * self.count
+    seen = 0
+    for bound, count in zip(BUCKET_BOUNDS_MS, self.counts):
+      seen += count
+      if seen >= rank:
+        return min(bound, self.max_ms)
+    return self.max_ms
+
+  def to_dict(self):
+    return {
+        "count": self.count,
+        "mean_ms": self.total_ms / self.count if self.count else 0.0,
+        "max_ms": self.max_ms,
+        "p50_ms": self.percentile(0.50),
+        "p95_ms": self.percentile(0.95),
+        "p99_ms": self.percentile(0.99),
+        "buckets": [[bound, count] for bound, count
+                    in zip(BUCKET_BOUNDS_MS + ("+Inf",), self.counts)],
+    }
+
+
+class StageStats(object):
+  """Latency histograms of each stage of each endpoint."""
+
+  def __init__(self):
+    self._histograms = {}
+    self._lock = threading.Lock()
+
+  def record(self, endpoint, stages):
+    """Adds the stages of a request to the histograms.
+    Args:
+        endpoint (string): Name of the endpoint serving the request.
+        stages (dict): Seconds spent in each stage.
+    """
+    with self._lock:
+      histograms = self._histograms.setdefault(endpoint, {})
+      for name, seconds in stages.items():
+        histogram = histograms.get(name)
+        if histogram is None:
+          histogram = histograms[name] = LatencyHistogram()
+        histogram.observe(seconds * 1000)
+
+  def to_dict(self):
+    """Returns the histograms, by endpoint and stage."""
+    with self._lock:
+      return {endpoint: {name: histogram.to_dict()
+                         for name, histogram in histograms.items()}
+              for endpoint, histograms in self._histograms.items()}
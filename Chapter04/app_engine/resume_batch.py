@@ -0,0 +1,188 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Batch rendering of resumes for a list of recipients.
+
+Recipients are read incrementally from the request body, and each resume
+is rendered and sent before the next one is read. So memory usage doesn't
+depend on the number of recipients, except for JSON arrays, which have to
+be parsed in full.
+"""
+import csv
+import io
+import itertools
+import json
+import re
+import zipfile
+
+
+class BatchError(ValueError):
+  """The list of recipients could not be parsed."""
+
+
+def _recipient(values):
+  if isinstance(values, dict):
+    name, company = values.get("name"), values.get("company")
+  elif isinstance(values, (list, tuple)) and len(values) <= 2:
+    name, company = (list(values) + [None, None])[:2]
+  else:
+    raise BatchError("Each recipient must be a (name, company) pair")
+  if not all(value is None or isinstance(value, str)
+             for value in (name, company)):
+    raise BatchError("Names and companies must be strings")
+  return name or None, company or None
+
+
+def _checked_rows(rows):
+  """Yields the rows of a text document, as BatchError if it is invalid."""
+  try:
+    yield from rows
+  except UnicodeDecodeError:
+    raise BatchError("The recipients must be encoded in UTF-8")
+  except csv.Error as error:
+    raise BatchError("Invalid CSV: {}".format(error))
+
+
+def parse_recipients(mimetype, stream):
+  """Yields the (name, company) pairs in a CSV, NDJSON or JSON document.
+  Args:
+      mimetype (string): Media type of the document.
+      stream (file): Binary file object with the document.
+  Returns:
+      Iterator over (name, company) tuples.
+  Raises:
+      BatchError: if the document can't be parsed.
+  """
+  if mimetype == "text/csv":
+    lines = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+    for row in _checked_rows(csv.reader(lines)):
+      if row and [value.strip().lower() for value in row] != [
+          "name", "company"]:
+        yield _recipient(row)
+  elif mimetype == "application/x-ndjson":
+    for line in _checked_rows(io.TextIOWrapper(stream, encoding="utf-8")):
+      if line.strip():
+        try:
+          yield _recipient(json.loads(line))
+        except json.JSONDecodeError:
+          raise BatchError("Invalid JSON line")
+  else:
+    try:
+      recipients = json.load(stream)
+    except (ValueError, UnicodeDecodeError):
+      recipients = None
+    if not isinstance(recipients, list):
+      raise BatchError("Expected a JSON array of recipients")
+    # The array is already in memory, so validate it before rendering
+    for recipient in [_recipient(values) for values in recipients]:
+      yield recipient
+
+
+def read_recipients(request):
+  """Yields the (name, company) pairs in the body of a request.
+  Args:
+      request (flask.Request): Request with a CSV, NDJSON or JSON body.
+  Returns:
+      Iterator over (name, company) tuples.
+  Raises:
+      BatchError: if the body can't be parsed.
+  """
+  return parse_recipients(request.mimetype, request.stream)
+
+
+def check_first(recipients):
+  """Parses the first recipient, so that an invalid body is found early.
+  Args:
+      recipients (iterator): (name, company) tuples.
+  Returns:
+      Iterator over the same (name, company) tuples.
+  Raises:
+      BatchError: if the first recipient can't be parsed.
+  """
+  first_recipient = next(recipients, None)
+  if first_recipient is None:
+    return iter(())
+  return itertools.chain([first_recipient], recipients)
+
+
+def render_ndjson(compiled_resume, recipients, build_header):
+  """Yields one JSON line per recipient with their resume.
+  Args:
+      compiled_resume (CompiledTemplate): Template of the resumes.
+      recipients (iterable): (name, company) tuples.
+      build_header (callable): Builds the header for a name and company.
+  Returns:
+      Iterator over the lines of the NDJSON document, as bytes. If a
+      recipient can't be parsed, the last line contains the error.
+  """
+  try:
+    for name, company in recipients:
+      resume_html = compiled_resume.render_bytes(build_header(name, company))
+      line = json.dumps({
+          "name": name,
+          "company": company,
+          "html": resume_html.decode("utf-8"),
+      })
+      yield line.encode("utf-8") + b"\n"
+  except BatchError as error:
+    yield json.dumps({"error": str(error)}).encode("utf-8") + b"\n"
+
+
+class _ChunkWriter(io.RawIOBase):
+  """Unseekable file object collecting the chunks written to it."""
+
+  def __init__(self):
+    self._chunks = []
+
+  def writable(self):
+    return True
+
+  def write(self, data):
+    self._chunks.append(bytes(data))
+    return len(data)
+
+  def pop(self):
+    data = b"".join(self._chunks)
+    self._chunks = []
+    return data
+
+
+def _file_name(index, name, company):
+  label = "-".join(value for value in (name, company) if value) or "resume"
+  label = re.sub(r"[^A-Za-z0-9]+", "_", label).strip("_")[:60] or "resume"
+  return "{:05d}-{}.html".format(index, label)
+
+
+def render_zip(compiled_resume, recipients, build_header):
+  """Yields a zip archive with one HTML file per recipient.
+  Args:
+      compiled_resume (CompiledTemplate): Template of the resumes.
+      recipients (iterable): (name, company) tuples.
+      build_header (callable): Builds the header for a name and company.
+  Returns:
+      Iterator over the chunks of the zip archive. If a recipient can't be
+      parsed, the archive ends with an ERROR.txt file containing the error.
+  """
+  # On an unseekable file, zipfile writes the sizes after each member, so
+  # each member can be sent as soon as it is compressed
+  writer = _ChunkWriter()
+  with zipfile.ZipFile(writer, "w", zipfile.ZIP_DEFLATED) as archive:
+    try:
+      for index, (name, company) in enumerate(recipients, 1):
+        resume_html = compiled_resume.render_bytes(
+            build_header(name, company))
+        archive.writestr(_file_name(index, name, company), resume_html)
+        yield writer.pop()
+    except BatchError as error:
+      archive.writestr("ERROR.txt", str(error) + "\n")
+  yield writer.pop()
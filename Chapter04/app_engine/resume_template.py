@@ -0,0 +1,210 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Resume templates compiled once into immutable byte segments.
+
+Instead of running str.replace() over the whole template on every request,
+the template is split around its ##TOKEN## placeholders when it is loaded,
+into literal segments and the slots between them. A resume is then
+rendered by sending the static segments as they are, with the value of
+each slot in between, so the cost of a request depends on the size of the
+output, not on the number of placeholders times the size of the template.
+
+The ##RESUME_HEAD## slot gets the customized header, and the other slots
+the values passed by name. Placeholders without a value are left as they
+are, as str.replace() would.
+
+Templates can also be precompressed. Each static segment is then deflated
+once at load time, and only the short slot values are compressed on each
+request. The pieces are joined into a single valid gzip stream, whose
+CRC-32 is combined with the precomputed CRC-32 of each static segment.
+"""
+import re
+import struct
+import zlib
+
+try:
+  import brotli
+except ImportError:
+  brotli = None
+
+RESUME_HEAD_TOKEN = "RESUME_HEAD"
+RESUME_HEAD_PLACEHOLDER = "##" + RESUME_HEAD_TOKEN + "##"
+
+# Placeholders are upper case names between double hashes, like ##ROLE##
+PLACEHOLDER_PATTERN = re.compile(r"##([A-Z][A-Z0-9_]*)##")
+
+# Gzip member header: deflate method, no flags, no mtime, unknown OS
+GZIP_HEADER = b"\x1f\x8b\x08\x00\x00\x00\x00\x00\x00\xff"
+
+
+def _gf2_times(matrix, vector):
+  total = 0
+  for column in matrix:
+    if not vector:
+      break
+    if vector & 1:
+      total ^= column
+    vector >>= 1
+  return total
+
+
+def _gf2_square(matrix):
+  return [_gf2_times(matrix, column) for column in matrix]
+
+
+def _crc32_shift(length):
+  """Returns the matrix that appends `length` bytes to a CRC-32.
+  Used as in zlib's crc32_combine(): crc(a + b) is
+  _gf2_times(_crc32_shift(len(b)), crc(a)) ^ crc(b).
+  """
+  # Operator for one zero bit, then for one zero byte
+  operator = [0xEDB88320] + [1 << bit for bit in range(31)]
+  for _ in range(3):
+    operator = _gf2_square(operator)
+  shift = [1 << bit for bit in range(32)]
+  while length:
+    if length & 1:
+      shift = [_gf2_times(operator, column) for column in shift]
+    length >>= 1
+    if length:
+      operator = _gf2_square(operator)
+  return shift
+
+
+def _deflate(data, final, level=9, wbits=zlib.MAX_WBITS, mem_level=8):
+  compressor = zlib.compressobj(level, zlib.DEFLATED, -wbits, mem_level)
+  return compressor.compress(data) + compressor.flush(
+      zlib.Z_FINISH if final else zlib.Z_SYNC_FLUSH)
+
+
+class CompiledTemplate(object):
+  """Resume template split into byte segments around its placeholders."""
+
+  __slots__ = ("segments", "slots", "size", "precompressed", "_markers",
+               "_deflated", "_crcs", "_shifts", "_brotli")
+
+  def __init__(self, resume_html, precompress=False):
+    """Compiles a template.
+    Args:
+        resume_html (string): Full raw HTML of the resume.
+        precompress (bool): Whether to also precompress the static segments.
+    """
+    # Literal segments and token names alternate in the split
+    parts = PLACEHOLDER_PATTERN.split(resume_html)
+    self.segments = tuple(part.encode("utf-8") for part in parts[::2])
+    self.slots = tuple(parts[1::2])
+    self._markers = {token: ("##" + token + "##").encode("utf-8")
+                     for token in self.slots}
+    self.size = sum(len(segment) for segment in self.segments)
+    self.precompressed = precompress
+    if precompress:
+      last = len(self.segments) - 1
+      self._deflated = tuple(
+          _deflate(segment, index == last)
+          for index, segment in enumerate(self.segments))
+      self._crcs = tuple(zlib.crc32(segment) for segment in self.segments)
+      self._shifts = tuple(
+          _crc32_shift(len(segment)) for segment in self.segments)
+      # Brotli streams can't be spliced, so only the resume without any
+      # customized value is precompressed with it
+      self._brotli = None
+      if brotli is not None:
+        self._brotli = brotli.compress(self.render_bytes(""))
+      self.size += sum(len(segment) for segment in self._deflated)
+
+  def _slot_values(self, header_text, values):
+    """Returns the bytes to insert in each slot."""
+    encoded = dict(self._markers)
+    encoded[RESUME_HEAD_TOKEN] = header_text.encode("utf-8")
+    if values:
+      for token, value in values.items():
+        if token in encoded:
+          encoded[token] = value.encode("utf-8")
+    return [encoded[token] for token in self.slots]
+
+  def render(self, header_text, values=None):
+    """Yields the chunks of the resume with the customized values.
+    Args:
+        header_text (string): Text to be used as customized header.
+        values (dict): Text for the other placeholders, by token name.
+    Returns:
+        Iterator over the byte chunks of the full resume, in HTML format.
+    """
+    yield self.segments[0]
+    for value, segment in zip(self._slot_values(header_text, values),
+                              self.segments[1:]):
+      if value:
+        yield value
+      yield segment
+
+  def render_bytes(self, header_text, values=None):
+    """Returns the full resume with the customized values as bytes.
+    Args:
+        header_text (string): Text to be used as customized header.
+        values (dict): Text for the other placeholders, by token name.
+    Returns:
+        The full resume, in HTML format.
+    """
+    parts = [b""] * (2 * len(self.slots) + 1)
+    parts[::2] = self.segments
+    parts[1::2] = self._slot_values(header_text, values)
+    return b"".join(parts)
+
+  def encodings(self, header_text, values=None):
+    """Returns the content codings available for the values, best first.
+    Args:
+        header_text (string): Text to be used as customized header.
+        values (dict): Text for the other placeholders, by token name.
+    Returns:
+        List of content codings, empty if the template isn't precompressed.
+    """
+    if not self.precompressed:
+      return []
+    if self._brotli is not None and not header_text and not values:
+      return ["br", "gzip"]
+    return ["gzip"]
+
+  def render_encoded(self, header_text, encoding, values=None):
+    """Yields the compressed chunks of the resume with the customized values.
+    Args:
+        header_text (string): Text to be used as customized header.
+        encoding (string): One of the content codings from encodings().
+        values (dict): Text for the other placeholders, by token name.
+    Returns:
+        Iterator over the compressed byte chunks of the full resume.
+    """
+    if encoding == "br":
+      yield self._brotli
+      return
+
+    # Each distinct value is compressed once. A small window and memory
+    # level make compressing these short values cheap
+    deflated_values = {}
+    yield GZIP_HEADER
+    yield self._deflated[0]
+    crc = self._crcs[0]
+    length = len(self.segments[0])
+    for index, value in enumerate(
+        self._slot_values(header_text, values), 1):
+      if value:
+        deflated = deflated_values.get(value)
+        if deflated is None:
+          deflated = deflated_values[value] = _deflate(value, False, 6, 9, 1)
+        yield deflated
+        crc = zlib.crc32(value, crc)
+        length += len(value)
+      yield self._deflated[index]
+      crc = _gf2_times(self._shifts[index], crc) ^ self._crcs[index]
+      length += len(self.segments[index])
+    yield struct.pack("<II", crc, length & 0xFFFFFFFF)
@@ -1,5 +1,14 @@
+import time
+MODULE_LOAD_START = time.perf_counter()
+
+from flask import Response
 import functions_framework
-from google.cloud import storage
+import json
+import os
+import threading
+
+from response_cache import ResponseCache, resume_etag
+from template_cache import TemplateCache, TemplateNotFound
 
 # Copyright 2023 Google LLC
 #
@@ -20,26 +29,82 @@ from google.cloud import storage
 BUCKET_NAME = "resume_xew878w6e"
 DEFAULT_TEMPLATE_NAME = "english.html"
 
+# Seconds between checks for new versions of a cached template, and maximum
+# number of bytes used to keep templates in memory
+TEMPLATE_CHECK_INTERVAL = float(os.getenv("TEMPLATE_CHECK_INTERVAL", "30"))
+TEMPLATE_CACHE_BYTES = int(os.getenv("TEMPLATE_CACHE_BYTES", "16777216"))
+
+# Maximum number of bytes used to keep personalized resumes in memory
+RESPONSE_CACHE_BYTES = int(os.getenv("RESPONSE_CACHE_BYTES", "8388608"))
+
+# Set to "true" to compress templates once when they are loaded, and send
+# compressed resumes to the clients that accept them
+PRECOMPRESS_TEMPLATES = os.getenv("PRECOMPRESS_TEMPLATES", "false") == "true"
+
+# Set to "true" to create the storage client and load the default template
+# while the instance starts, instead of during its first request
+PREFETCH_DEFAULT_TEMPLATE = (
+    os.getenv("PREFETCH_DEFAULT_TEMPLATE", "false") == "true")
+
+# Maximum number of connections to Cloud Storage kept open for reuse
+STORAGE_POOL_SIZE = int(os.getenv("STORAGE_POOL_SIZE", "10"))
+
+# Timings of the instance start, in milliseconds
+startup_timings = {
+    "import_ms": (time.perf_counter() - MODULE_LOAD_START) * 1000,
+}
+
+storage_client = None
+storage_client_lock = threading.Lock()
+
+def get_storage_client():
+  """Returns the Cloud Storage client shared by all requests.
+  The client library is imported and the client is created on first use.
+  Its HTTP session keeps a pool of connections open, so requests served by
+  a warm instance don't pay for a new TLS handshake.
+  Returns:
+      The storage.Client of this instance.
+  """
+  global storage_client
+  with storage_client_lock:
+    if storage_client is None:
+      start = time.perf_counter()
+      from google.cloud import storage
+      import requests.adapters
+      imported = time.perf_counter()
+      # Against a local fake GCS, don't look for credentials that may not
+      # exist, which also takes seconds probing the metadata server
+      if os.getenv("STORAGE_EMULATOR_HOST"):
+        client = storage.Client.create_anonymous_client()
+      else:
+        client = storage.Client()
+      adapter = requests.adapters.HTTPAdapter(
+          pool_connections=1, pool_maxsize=STORAGE_POOL_SIZE)
+      client._http.mount("https://", adapter)
+      client._http.mount("http://", adapter)
+      startup_timings["storage_import_ms"] = (imported - start) * 1000
+      startup_timings["storage_client_ms"] = (
+          time.perf_counter() - imported) * 1000
+      storage_client = client
+    return storage_client
+
+# Templates and resumes are shared by all the requests served by this instance
+response_cache = ResponseCache(RESPONSE_CACHE_BYTES)
+template_cache = TemplateCache(
+    BUCKET_NAME, TEMPLATE_CHECK_INTERVAL, TEMPLATE_CACHE_BYTES,
+    on_change=response_cache.invalidate_template,
+    precompress=PRECOMPRESS_TEMPLATES, client_factory=get_storage_client)
+
 def load_resume(template):
   """Loads the raw HTML of the resume from a predefined file.
+  Templates are cached in memory and only downloaded again from the bucket
+  when a new version of the file is uploaded.
   Args:
       template (string): File name of the template to use.  
   Returns:
       Full raw HTML of the resume.
   """
-
-  # Instantiate a Cloud Storage client
-  storage_client = storage.Client()
-  
-  # Open the bucket
-  bucket = storage_client.bucket(BUCKET_NAME)
-  
-  # And get to the blob containing our HTML template
-  blob = bucket.blob(template)
-  
-  # Open the blob and return its contents
-  with blob.open("r") as resume_file:
-    return(resume_file.read())
+  return template_cache.get(template)
 
 def build_resume_header(name, company):
   """Builds the customized header for the resume.
@@ -72,6 +137,49 @@ def replace_resume_header(resume_html, header_text):
   """
   return resume_html.replace("##RESUME_HEAD##", header_text)
 
+def resume_response(request, template, name, company):
+  """Builds the HTTP response with the resume, using cached copies if possible.
+  Args:
+      request (flask.Request): The request object.
+      template (string): File name of the template to use.
+      name (string): Name of the person receiving the resume.
+      company (string): Company receiving the resume.
+  Returns:
+      The response, which is a 304 if the client already has this resume.
+  """
+  cached_template = template_cache.lookup(template)
+  compiled_resume = cached_template.compiled
+  generation = cached_template.generation
+  resume_header = build_resume_header(name, company)
+  etag = resume_etag(template, generation, resume_header)
+  # Precompressed resumes have their own ETag, as their content is different
+  encoding = request.accept_encodings.best_match(
+      compiled_resume.encodings(resume_header))
+  if encoding:
+    etag = etag + "-" + encoding
+  if request.if_none_match.contains(etag):
+    response = Response(status=304)
+  elif encoding:
+    response = Response(
+        compiled_resume.render_encoded(resume_header, encoding),
+        mimetype="text/html")
+    response.content_encoding = encoding
+  else:
+    resume_bytes = response_cache.get(template, generation, name, company)
+    if resume_bytes is not None:
+      response = Response(resume_bytes, mimetype="text/html")
+    elif compiled_resume.size <= response_cache.max_bytes:
+      resume_bytes = compiled_resume.render_bytes(resume_header)
+      response_cache.put(template, generation, name, company, resume_bytes)
+      response = Response(resume_bytes, mimetype="text/html")
+    else:
+      response = Response(compiled_resume.render(resume_header),
+                          mimetype="text/html")
+  response.set_etag(etag)
+  if compiled_resume.precompressed:
+    response.vary.add("Accept-Encoding")
+  return response
+
 def return_resume(template, name, company):
   """Loads the resume, replaces the header and returns it.
   Args:
@@ -105,7 +213,34 @@ def return_resume_trigger(request):
   template = request.args.get('template', DEFAULT_TEMPLATE_NAME)
   name = request.args.get('name')
   company = request.args.get('company')
-  return(return_resume(template, name, company))
+  try:
+    return resume_response(request, template, name, company)
+  except TemplateNotFound:
+    return 'Template {} not found'.format(template), 404
+
+def prefetch_default_template():
+  """Loads the default template in the cache while the instance starts.
+  """
+  start = time.perf_counter()
+  try:
+    template_cache.lookup(DEFAULT_TEMPLATE_NAME)
+  except Exception as error:
+    # The first request will try again, so don't prevent the instance start
+    print("Could not prefetch template {}: {}".format(
+        DEFAULT_TEMPLATE_NAME, error))
+  startup_timings["prefetch_ms"] = (time.perf_counter() - start) * 1000
+
+def log_startup_timings():
+  """Writes the startup timings as a structured log entry.
+  """
+  startup_timings["init_ms"] = (
+      time.perf_counter() - MODULE_LOAD_START) * 1000
+  print(json.dumps(dict(
+      startup_timings, severity="INFO", message="Instance started")))
+
+if PREFETCH_DEFAULT_TEMPLATE:
+  prefetch_default_template()
+log_startup_timings()
 
 def main():
   """Main function for tests using the command line.
@@ -0,0 +1,127 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Bounded LRU cache of personalized resumes.
+
+Most of the traffic comes from the same few recipients reloading their
+link, so rendered resumes are cached by template, template version, name
+and company. Since a resume only depends on those values, its ETag is
+derived from them too, and conditional requests can be answered without
+rendering anything.
+"""
+import collections
+import hashlib
+import threading
+
+
+def resume_etag(template, version, header_text):
+  """Returns the strong ETag of a personalized resume.
+  Args:
+      template (string): File name of the template used.
+      version: Version (generation) of the template used.
+      header_text (string): Customized header of the resume.
+  Returns:
+      ETag value for the resume, without quotes.
+  """
+  digest = hashlib.sha256(
+      "\0".join((template, str(version), header_text)).encode("utf-8"))
+  return digest.hexdigest()[:32]
+
+
+class ResponseCache(object):
+  """Thread-safe LRU cache of rendered resumes, bounded in bytes."""
+
+  def __init__(self, max_bytes=8 * 1024 * 1024):
+    """Creates a new cache.
+    Args:
+        max_bytes (int): Maximum total size of the cached resumes.
+    """
+    self.max_bytes = max_bytes
+    self.hits = 0
+    self.misses = 0
+    self.evictions = 0
+    self._entries = collections.OrderedDict()
+    self._keys_by_template = collections.defaultdict(set)
+    self._size = 0
+    self._lock = threading.Lock()
+
+  def get(self, template, version, name, company):
+    """Returns a cached resume, or None if it is not in the cache.
+    Args:
+        template (string): File name of the template used.
+        version: Version (generation) of the template used.
+        name (string): Name of the person receiving the resume.
+        company (string): Company receiving the resume.
+    Returns:
+        The full resume as bytes, or None.
+    """
+    key = (template, version, name, company)
+    with self._lock:
+      body = self._entries.get(key)
+      if body is None:
+        self.misses += 1
+        return None
+      self._entries.move_to_end(key)
+      self.hits += 1
+      return body
+
+  def put(self, template, version, name, company, body):
+    """Stores a rendered resume, evicting the least recently used ones.
+    Args:
+        template (string): File name of the template used.
+        version: Version (generation) of the template used.
+        name (string): Name of the person receiving the resume.
+        company (string): Company receiving the resume.
+        body (bytes): The full resume.
+    """
+    if len(body) > self.max_bytes:
+      return
+    key = (template, version, name, company)
+    with self._lock:
+      previous = self._entries.pop(key, None)
+      if previous is not None:
+        self._size -= len(previous)
+      self._entries[key] = body
+      self._keys_by_template[template].add(key)
+      self._size += len(body)
+      while self._size > self.max_bytes:
+        evicted_key, evicted = self._entries.popitem(last=False)
+        self._forget(evicted_key, evicted)
+        self.evictions += 1
+
+  def invalidate_template(self, template):
+    """Drops all the cached resumes rendered from a template.
+    Args:
+        template (string): File name of the template.
+    """
+    with self._lock:
+      for key in self._keys_by_template.pop(template, ()):
+        self._size -= len(self._entries.pop(key))
+
+  def stats(self):
+    """Returns the cache counters as a dictionary."""
+    with self._lock:
+      return {
+          "hits": self.hits,
+          "misses": self.misses,
+          "evictions": self.evictions,
+          "entries": len(self._entries),
+          "bytes": self._size,
+      }
+
+  def _forget(self, key, body):
+    self._size -= len(body)
+    keys = self._keys_by_template[key[0]]
+    keys.discard(key)
+    if not keys:
+      del self._keys_by_template[key[0]]
@@ -0,0 +1,350 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""In-memory cache for the resume templates stored in Cloud Storage.
+
+Templates are kept decoded in memory, keyed by template name. Once every
+check interval the cache asks Cloud Storage for the object metadata only,
+and the template is downloaded again only if its generation has changed.
+The total size of the cached templates is bounded, evicting the least
+recently used ones first. Each cached template is also compiled once, so
+requests can stream it without copying the full document. Requests for a
+template that is already being checked or downloaded, by another request
+or by the refresher, wait for that load, so a burst of requests makes a
+single round of calls to Cloud Storage.
+
+A background refresher can also list the bucket periodically, loading all
+the templates before they are requested and reloading the ones that
+change, so requests don't have to check Cloud Storage themselves. Once the
+bucket has been listed, templates missing from it fail immediately.
+
+The Cloud Storage client honours the STORAGE_EMULATOR_HOST environment
+variable, so the cache can also be used offline against a local fake GCS.
+The client library is only imported when the first client is created, to
+keep it out of the cold start path until it is needed.
+"""
+import collections
+import concurrent.futures
+import functools
+import logging
+import threading
+import time
+
+from resume_template import CompiledTemplate
+
+
+CachedTemplate = collections.namedtuple(
+    "CachedTemplate",
+    ["html", "compiled", "generation", "size", "checked_at"])
+
+
+class TemplateNotFound(Exception):
+  """The template does not exist in the bucket."""
+
+
+class TemplateCache(object):
+  """Thread-safe, generation-aware LRU cache of resume templates."""
+
+  def __init__(self, bucket_name, check_interval=30,
+               max_bytes=16 * 1024 * 1024, client=None, on_change=None,
+               precompress=False, client_factory=None):
+    """Creates a new cache.
+    Args:
+        bucket_name (string): Name of the bucket storing the templates.
+        check_interval (float): Seconds between generation checks.
+        max_bytes (int): Maximum total size of the cached templates.
+        client (storage.Client): Client to use. Created on first use if None.
+        on_change (callable): Called with the template name when a cached
+            template is replaced by a new generation or invalidated.
+        precompress (bool): Whether to precompress the compiled templates.
+        client_factory (callable): Returns the client to use when client is
+            None. Defaults to creating a new storage.Client.
+    """
+    self.bucket_name = bucket_name
+    self.check_interval = check_interval
+    self.max_bytes = max_bytes
+    self.on_change = on_change
+    self.precompress = precompress
+    self._client = client
+    self._client_factory = client_factory
+    self._bucket = None
+    self._entries = collections.OrderedDict()
+    self._size = 0
+    self._lock = threading.Lock()
+    # Future of each template being checked or downloaded
+    self._loading = {}
+    # Generation of each template in the bucket, once it has been listed
+    self._index = None
+    # Generation of the templates loaded by refresh(), only used by it
+    self._prewarmed = {}
+    self._refresher = None
+    self._stopped = threading.Event()
+    self._listed = threading.Event()
+
+  def _get_bucket(self):
+    if self._bucket is None:
+      if self._client is None:
+        if self._client_factory is not None:
+          self._client = self._client_factory()
+        else:
+          from google.cloud import storage
+          self._client = storage.Client()
+      self._bucket = self._client.bucket(self.bucket_name)
+    return self._bucket
+
+  def get(self, template):
+    """Returns the raw HTML of a template, downloading it only if needed.
+    Args:
+        template (string): File name of the template to use.
+    Returns:
+        Full raw HTML of the template.
+    Raises:
+        TemplateNotFound: if the template does not exist in the bucket.
+    """
+    return self.lookup(template).html
+
+  def get_compiled(self, template):
+    """Returns the compiled template, downloading it only if needed.
+    Args:
+        template (string): File name of the template to use.
+    Returns:
+        CompiledTemplate for the template.
+    Raises:
+        TemplateNotFound: if the template does not exist in the bucket.
+    """
+    return self.lookup(template).compiled
+
+  def lookup(self, template):
+    """Returns the cached entry of a template, downloading it if needed.
+    Args:
+        template (string): File name of the template to use.
+    Returns:
+        CachedTemplate with the raw HTML, compiled template and generation.
+    Raises:
+        TemplateNotFound: if the template does not exist in the bucket.
+    """
+    now = time.monotonic()
+    entry, fresh = self._cached_entry(template, now)
+    if fresh:
+      return entry
+    return self._load_once(template, lambda: self._check(template, now))
+
+  def _load_once(self, template, load):
+    """Runs load, or waits for the load of the template already running."""
+    with self._lock:
+      loading = self._loading.get(template)
+      running = loading is not None
+      if not running:
+        loading = self._loading[template] = concurrent.futures.Future()
+    if running:
+      return loading.result()
+    try:
+      result = load()
+    except BaseException as error:
+      loading.set_exception(error)
+      raise
+    else:
+      loading.set_result(result)
+      return result
+    finally:
+      with self._lock:
+        del self._loading[template]
+
+  def _check(self, template, now):
+    """Checks the generation of a template, downloading it if it changed."""
+    # Another thread may have loaded it while we waited for our turn
+    entry, fresh = self._cached_entry(template, now)
+    if fresh:
+      return entry
+
+    blob = self._get_bucket().blob(template)
+    # Already imported with the client library, by _get_bucket()
+    from google.api_core import exceptions
+    try:
+      # Fetch only the object metadata to find out its current generation
+      blob.reload()
+      if entry is not None and entry.generation == blob.generation:
+        entry = entry._replace(checked_at=now)
+        self._store(template, entry)
+        return entry
+      return self._load(template, blob, entry, now)
+    except exceptions.NotFound:
+      raise TemplateNotFound(template)
+
+  def _cached_entry(self, template, now):
+    """Returns the cached entry of a template, and whether it is fresh.
+    Entries are fresh during the check interval, and while they have the
+    generation found by the last listing of the bucket.
+    Raises:
+        TemplateNotFound: if the bucket was listed without the template.
+    """
+    index = self._index
+    with self._lock:
+      entry = self._entries.get(template)
+      if entry is not None:
+        self._entries.move_to_end(template)
+        if (now - entry.checked_at < self.check_interval or
+            index is not None and index.get(template) == entry.generation):
+          return entry, True
+    if index is not None and template not in index:
+      raise TemplateNotFound(template)
+    return entry, False
+
+  def _load(self, template, blob, previous, now):
+    """Downloads and caches the generation of a template in blob."""
+    logging.info("Loading template file %s (generation %s).",
+                 template, blob.generation)
+    content = blob.download_as_bytes(if_generation_match=blob.generation)
+    html = content.decode("utf-8")
+    compiled = CompiledTemplate(html, self.precompress)
+    entry = CachedTemplate(html, compiled, blob.generation,
+                           len(content) + compiled.size, now)
+    self._store(template, entry)
+    if previous is not None and self.on_change is not None:
+      self.on_change(template)
+    return entry
+
+  def _load_listed(self, blob, now):
+    """Downloads the generation of a template found by listing the bucket."""
+    # A request may have loaded it since the listing
+    with self._lock:
+      entry = self._entries.get(blob.name)
+    if entry is not None and entry.generation == blob.generation:
+      return entry
+    return self._load(blob.name, blob, entry, now)
+
+  def templates(self):
+    """Returns the names of the templates found by the last listing.
+    Returns:
+        Sorted list of template names, or None if the bucket wasn't listed.
+    """
+    index = self._index
+    return None if index is None else sorted(index)
+
+  def refresh(self):
+    """Lists the bucket, and loads the templates that are new or changed.
+    Templates deleted from the bucket are dropped from the cache, and from
+    then on templates missing from the bucket fail with TemplateNotFound.
+    Returns:
+        Number of templates downloaded.
+    """
+    blobs = [blob for blob in self._get_bucket().list_blobs()
+             if not blob.name.endswith("/")]
+    now = time.monotonic()
+    loaded = 0
+    for blob in blobs:
+      with self._lock:
+        entry = self._entries.get(blob.name)
+      if entry is not None and entry.generation == blob.generation:
+        continue
+      # Templates evicted since they were loaded wait for their next request,
+      # so that a bucket larger than the cache isn't downloaded every time
+      if entry is None and self._prewarmed.get(blob.name) == blob.generation:
+        continue
+      try:
+        # Shares the load with the requests asking for the template meanwhile
+        self._load_once(
+            blob.name, functools.partial(self._load_listed, blob, now))
+        self._prewarmed[blob.name] = blob.generation
+        loaded += 1
+      except Exception:
+        # Probably replaced since the listing, the next one will load it
+        logging.exception("Could not load template file %s.", blob.name)
+
+    index = {blob.name: blob.generation for blob in blobs}
+    self._index = index
+    with self._lock:
+      deleted = [name for name in self._entries if name not in index]
+    for name in deleted:
+      logging.info("Template file %s was deleted.", name)
+      self.invalidate(name)
+    for name in [name for name in self._prewarmed if name not in index]:
+      del self._prewarmed[name]
+    return loaded
+
+  def start_refresher(self, interval=60):
+    """Refreshes the templates now and then periodically, in a thread.
+    Does nothing if the refresher is already running.
+    Args:
+        interval (float): Seconds between two listings of the bucket.
+    """
+    if self._refresher is not None:
+      return
+    with self._lock:
+      if self._refresher is not None:
+        return
+      self._refresher = threading.Thread(
+          target=self._refresh_forever, args=(interval,),
+          name="template-refresher", daemon=True)
+    self._refresher.start()
+
+  def wait_until_listed(self, timeout=None):
+    """Waits for the first listing of the bucket by the refresher.
+    Args:
+        timeout (float): Maximum number of seconds to wait.
+    Returns:
+        Whether the bucket was listed.
+    """
+    return self._listed.wait(timeout)
+
+  def stop_refresher(self):
+    """Stops the refresher thread, after its current refresh."""
+    self._stopped.set()
+
+  def _refresh_forever(self, interval):
+    while not self._stopped.is_set():
+      start = time.monotonic()
+      try:
+        loaded = self.refresh()
+        if loaded:
+          logging.info("Loaded %d templates in %.2f s.",
+                       loaded, time.monotonic() - start)
+      except Exception:
+        logging.exception("Could not refresh the templates.")
+      finally:
+        # Don't keep waiters blocked if the first refresh failed
+        self._listed.set()
+      self._stopped.wait(interval)
+
+  def invalidate(self, template=None):
+    """Drops one template from the cache, or all of them if not specified.
+    Args:
+        template (string): File name of the template to drop.
+    """
+    with self._lock:
+      if template is None:
+        templates = list(self._entries)
+        self._entries.clear()
+        self._size = 0
+      elif template in self._entries:
+        templates = [template]
+        self._size -= self._entries.pop(template).size
+      else:
+        templates = []
+    if self.on_change is not None:
+      for name in templates:
+        self.on_change(name)
+
+  def _store(self, template, entry):
+    with self._lock:
+      previous = self._entries.pop(template, None)
+      if previous is not None:
+        self._size -= previous.size
+      if entry.size > self.max_bytes:
+        return
+      self._entries[template] = entry
+      self._size += entry.size
+      # Evict the least recently used templates until we fit in memory
+      while self._size > self.max_bytes:
+        _, evicted = self._entries.popitem(last=False)
+        self._size -= evicted.size
@@ -0,0 +1,121 @@
+#!/usr/bin/env python
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Micro-benchmark of the resume rendering paths.
+
+Compares replacing the header placeholder over the full template on every
+request, as replace_resume_header does, with rendering a template that was
+compiled once into byte segments. Larger templates are built by padding
+english.html with extra content after the placeholder.
+
+Then compares filling several placeholders with one str.replace() per
+token, which scans the template once per token, with rendering all of them
+in a single pass.
+
+Usage: python benchmark_template.py [iterations]
+"""
+import sys
+import timeit
+
+from main import build_resume_header, replace_resume_header
+from resume_template import CompiledTemplate
+
+TEMPLATE_FILE = "english.html"
+TEMPLATE_SIZES = [1, 64, 1024, 8192]  # Approximate sizes in KiB
+TOKEN_COUNTS = [1, 4, 16]
+TOKEN_TEMPLATE_SIZES = [64, 1024]
+
+
+def build_template(size_kib):
+  with open(TEMPLATE_FILE, "r") as template_file:
+    resume_html = template_file.read()
+  padding = "<p>" + "x" * 1020 + "</p>\n"
+  missing = max(0, size_kib * 1024 - len(resume_html))
+  return resume_html.replace(
+      "</body>", padding * (missing // len(padding)) + "</body>")
+
+
+def add_tokens(resume_html, count):
+  """Adds placeholders spread over the template, returns their values."""
+  values = {"FIELD_{}".format(index): "Value {}".format(index)
+            for index in range(count - 1)}
+  step = len(resume_html) // (len(values) + 1)
+  parts = [resume_html[index * step:(index + 1) * step]
+           for index in range(len(values))]
+  parts.append(resume_html[len(values) * step:])
+  # Cut right after a tag, so placeholders don't break the markup
+  tagged = [parts[0]]
+  for token, part in zip(values, parts[1:]):
+    cut = part.find(">") + 1
+    tagged.append(part[:cut] + "##" + token + "##" + part[cut:])
+  return "".join(tagged), values
+
+
+def replace_tokens(resume_html, header, values):
+  resume_html = replace_resume_header(resume_html, header)
+  for token, value in values.items():
+    resume_html = resume_html.replace("##" + token + "##", value)
+  return resume_html
+
+
+def compare_tokens(iterations, header):
+  print("\n{:>10} {:>7} {:>14} {:>14} {:>8}".format(
+      "size", "tokens", "replace (us)", "compiled (us)", "speedup"))
+  for size_kib in TOKEN_TEMPLATE_SIZES:
+    for count in TOKEN_COUNTS:
+      resume_html, values = add_tokens(build_template(size_kib), count)
+      compiled = CompiledTemplate(resume_html)
+      assert (compiled.render_bytes(header, values) ==
+              replace_tokens(resume_html, header, values).encode("utf-8"))
+
+      # Both paths build the full document as bytes
+      replace_time = timeit.timeit(
+          lambda: replace_tokens(resume_html, header, values).encode("utf-8"),
+          number=iterations) / iterations
+      compiled_time = timeit.timeit(
+          lambda: compiled.render_bytes(header, values),
+          number=iterations) / iterations
+      print("{:>7}KiB {:>7} {:>14.2f} {:>14.2f} {:>7.1f}x".format(
+          len(resume_html) // 1024, count, replace_time * 1e6,
+          compiled_time * 1e6, replace_time / compiled_time))
+
+
+def main():
+  iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 200
+  header = build_resume_header("John Smith", "StarTalent")
+  print("{:>10} {:>14} {:>14} {:>8}".format(
+      "size", "replace (us)", "compiled (us)", "speedup"))
+  for size_kib in TEMPLATE_SIZES:
+    resume_html = build_template(size_kib)
+    compiled = CompiledTemplate(resume_html)
+    assert (compiled.render_bytes(header) ==
+            replace_resume_header(resume_html, header).encode("utf-8"))
+
+    # Both paths produce the bytes sent to the client
+    replace_time = timeit.timeit(
+        lambda: replace_resume_header(resume_html, header).encode("utf-8"),
+        number=iterations) / iterations
+    # The compiled path streams the chunks without joining them
+    compiled_time = timeit.timeit(
+        lambda: list(compiled.render(header)),
+        number=iterations) / iterations
+    print("{:>7}KiB {:>14.2f} {:>14.2f} {:>7.1f}x".format(
+        len(resume_html) // 1024, replace_time * 1e6, compiled_time * 1e6,
+        replace_time / compiled_time))
+
+  compare_tokens(iterations, header)
+
+
+if __name__ == "__main__":
+  main()
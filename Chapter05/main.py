@@ -13,12 +13,30 @@
 # See the License for the specific language governing permissions and
 # limitations under the License.
 
-from flask import Flask, request
+import os
+
+from flask import Flask, Response, abort, request
+
+from template_store import TemplateNotFound, TemplateStore
 
 DEFAULT_TEMPLATE_NAME = "english.html"
 
+# Directory containing the template files, and seconds between checks for
+# changes in a template file
+TEMPLATE_DIR = os.getenv(
+    "TEMPLATE_DIR", os.path.dirname(os.path.abspath(__file__)))
+TEMPLATE_CHECK_INTERVAL = float(os.getenv("TEMPLATE_CHECK_INTERVAL", "1"))
+
+# Set to "true" to compress templates once when they are loaded, and send
+# compressed resumes to the clients that accept them
+PRECOMPRESS_TEMPLATES = os.getenv("PRECOMPRESS_TEMPLATES", "false") == "true"
+
 app = Flask(__name__)
 
+# Templates are shared by all the threads of the worker
+template_store = TemplateStore(
+    TEMPLATE_DIR, TEMPLATE_CHECK_INTERVAL, PRECOMPRESS_TEMPLATES)
+
 def load_resume(template):
   """Loads the raw HTML of the resume from a predefined file.
   Args:
@@ -26,8 +44,7 @@ def load_resume(template):
   Returns:
       Full raw HTML of the resume.
   """
-  resume_file = open(template, "r")
-  return(resume_file.read())
+  return template_store.get(template).html
 
 
 def build_resume_header(name, company):
@@ -61,6 +78,35 @@ def replace_resume_header(resume_html, header_text):
   """
   return resume_html.replace("##RESUME_HEAD##", header_text)
 
+def load_compiled_resume(template):
+  """Loads the resume template, already split around its header.
+  Args:
+      template (string): File name of the template to use.
+  Returns:
+      CompiledTemplate for the resume.
+  """
+  return template_store.get(template).compiled
+
+def stream_resume(template, name, company, accept_encodings=()):
+  """Loads the resume and returns it in chunks with the customized header.
+  Args:
+      template (string): File name of the template to use.
+      name (string): Name of the person receiving the resume.
+      company (string): Company receiving the resume.
+      accept_encodings (werkzeug.datastructures.Accept): Content codings
+          accepted by the client.
+  Returns:
+      Iterator over the byte chunks of the resume, in HTML format, and the
+      content coding used for them, or None if they are not compressed.
+  """
+  compiled_resume = load_compiled_resume(template)
+  resume_header = build_resume_header(name, company)
+  encodings = compiled_resume.encodings(resume_header)
+  encoding = accept_encodings.best_match(encodings) if encodings else None
+  if encoding:
+    return compiled_resume.render_encoded(resume_header, encoding), encoding
+  return compiled_resume.render(resume_header), None
+
 def return_resume(template, name, company):
   """Loads the resume, replaces the header and returns it.
   Args:
@@ -87,8 +133,17 @@ def get():
     company = request.args.get('company', None)
     if company:
       print('Customizing for company ', company)
-    resume_html = return_resume(template, name, company)
-    return resume_html
+    try:
+      resume_chunks, encoding = stream_resume(
+          template, name, company, request.accept_encodings)
+    except TemplateNotFound:
+      abort(404)
+    response = Response(resume_chunks, mimetype="text/html")
+    if encoding:
+      response.content_encoding = encoding
+    if PRECOMPRESS_TEMPLATES:
+      response.vary.add("Accept-Encoding")
+    return response
 
 # This is only used when running locally. When running live, gunicorn runs
 # the application.
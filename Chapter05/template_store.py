@@ -0,0 +1,105 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Store of the resume templates found in a local directory.
+
+Each template file is read and compiled only once, and the result is
+shared by all the threads of the process. Once every check interval the
+store compares the inode, size and modification time of the file, and if it
+changed the template is loaded again and swapped in atomically, so threads
+always see either the old or the new version.
+
+Template names are validated before touching the filesystem, so names with
+path separators or pointing outside the template directory are rejected.
+Only HTML files can be used as templates, so the store never serves other
+files that may share the directory, like the source code of the service.
+"""
+import collections
+import os
+import threading
+import time
+
+from resume_template import CompiledTemplate
+
+
+TEMPLATE_EXTENSION = ".html"
+
+LoadedTemplate = collections.namedtuple(
+    "LoadedTemplate", ["html", "compiled", "file_id", "checked_at"])
+
+
+class TemplateNotFound(Exception):
+  """The template name is not valid or the file does not exist."""
+
+
+class TemplateStore(object):
+  """Thread-safe store of the compiled templates in a directory."""
+
+  def __init__(self, template_dir, check_interval=1.0, precompress=False):
+    """Creates a new store.
+    Args:
+        template_dir (string): Directory containing the template files.
+        check_interval (float): Seconds between checks for file changes.
+        precompress (bool): Whether to precompress the compiled templates.
+    """
+    self.template_dir = os.path.abspath(template_dir)
+    self.check_interval = check_interval
+    self.precompress = precompress
+    self._entries = {}
+    self._lock = threading.Lock()
+
+  def get(self, template):
+    """Returns a template, loading it again only if its file changed.
+    Args:
+        template (string): File name of the template to use.
+    Returns:
+        LoadedTemplate with the raw HTML and the compiled template.
+    Raises:
+        TemplateNotFound: if the name is not valid or the file doesn't exist.
+    """
+    entry = self._entries.get(template)
+    now = time.monotonic()
+    if entry is not None and now - entry.checked_at < self.check_interval:
+      return entry
+
+    path = self._path(template)
+    try:
+      stat = os.stat(path)
+    except OSError:
+      raise TemplateNotFound(template)
+    file_id = (stat.st_dev, stat.st_ino, stat.st_size, stat.st_mtime_ns)
+    with self._lock:
+      entry = self._entries.get(template)
+      if entry is None or entry.file_id != file_id:
+        entry = self._load(path, file_id, now)
+      else:
+        entry = entry._replace(checked_at=now)
+      # Replacing the entry is atomic, readers never see a partial template
+      self._entries[template] = entry
+    return entry
+
+  def _path(self, template):
+    if (not template.endswith(TEMPLATE_EXTENSION) or "\0" in template
+        or os.sep in template or (os.altsep and os.altsep in template)):
+      raise TemplateNotFound(template)
+    return os.path.join(self.template_dir, template)
+
+  def _load(self, path, file_id, now):
+    # The compiled segments are copies, so the file is closed right after
+    try:
+      with open(path, "rb") as template_file:
+        html = template_file.read().decode("utf-8")
+    except OSError:
+      raise TemplateNotFound(os.path.basename(path))
+    return LoadedTemplate(
+        html, CompiledTemplate(html, self.precompress), file_id, now)
@@ -17,12 +17,60 @@ Basic web-based phonebook implemented using Flask. Each contact has two
 fields: name and phone number. The home page will list all contacts sorted by
 name together with a form to add new entries. Each contact is listed with a
 button to delete it.
+
+Contacts are listed in pages of PAGE_SIZE entries. Pages are found with a
+cursor on the (name, id) of the first or last contact of the previous
+page, so every page is an index range scan, however large the phonebook.
+
+Contacts can also be imported from a CSV file posted to /import, either
+as a text/csv body or in the file field of a form, and exported as CSV
+from /export. Both read and write the CSV incrementally.
+
+/search?q= finds the contacts whose name, or phone number if the query
+looks like one, starts with the query. Phone numbers are also stored
+with their digits only, so that the search ignores their punctuation.
+Both searches are index range scans.
+
+Rendered pages of the list are cached in memory, tagged with a version of
+the data that every write increments. With PAGE_CACHE=database, the
+default, the version is kept in the database, so that each replica sees
+the writes of the others with a single primary key lookup per page view.
+With PAGE_CACHE=local, which is only correct with a single replica, the
+version is kept in memory and cached pages need no query at all.
+
+/metrics serves, in the Prometheus format, the connection pool usage, the
+time requests wait for a connection, and the latency of each type of
+statement. The pool is sized with DB_POOL_SIZE and DB_MAX_OVERFLOW.
+
+With GROUP_COMMIT_WINDOW_MS set, concurrent additions and deletions are
+committed together by a single writer, so that bursts of writes need far
+fewer commits.
+
+With DB_READ_URL or DB_READ_PORT set, lists, searches and exports are read
+from a read replica, and writes go to the primary. A session reads from
+the primary for READ_YOUR_WRITES_SECONDS after its own writes, so that it
+sees them even if the replica lags behind.
 """
+import base64
+import collections
+import csv
+import io
+import json
+import logging
+import math
 import os
+import re
+import threading
+import time
+import urllib.parse
 import sqlalchemy
+import db_metrics
+import group_commit
+from flask import after_this_request
 from flask import Flask
+from flask import Response
 from flask import request
-from sqlalchemy.ext.automap import automap_base
+from werkzeug.wsgi import ClosingIterator
 
 
 HTML_TEMPLATE = """
@@ -52,26 +100,312 @@ HTML_TEMPLATE = """
 db_user = os.getenv("DB_USER")
 db_pass = os.getenv("DB_PASS")
 
-pool = sqlalchemy.create_engine(
-    sqlalchemy.engine.url.URL.create(
-        drivername="mysql+pymysql",
-        username=db_user,
-        password=db_pass,
-        host="127.0.0.1",
-        port="3306",
-        database="phonebook",
-    ),
+# Connections kept open in the pool, extra connections opened when they are
+# all in use, and seconds a request waits for a connection before failing
+db_pool_size = int(os.getenv("DB_POOL_SIZE", "5"))
+db_max_overflow = int(os.getenv("DB_MAX_OVERFLOW", "10"))
+db_pool_timeout = float(os.getenv("DB_POOL_TIMEOUT", "30"))
+
+# Full database URL, which replaces the Cloud SQL connection if set. For
+# example sqlite:///phonebook.db to run locally
+db_url = os.getenv("DB_URL")
+
+pool_settings = dict(
+    poolclass=db_metrics.TimedQueuePool,
+    pool_size=db_pool_size,
+    max_overflow=db_max_overflow,
+    pool_timeout=db_pool_timeout,
 )
+if db_url:
+  pool = sqlalchemy.create_engine(db_url, **pool_settings)
+else:
+  pool = sqlalchemy.create_engine(
+      sqlalchemy.engine.url.URL.create(
+          drivername="mysql+pymysql",
+          username=db_user,
+          password=db_pass,
+          host="127.0.0.1",
+          port="3306",
+          database="phonebook",
+      ),
+      **pool_settings,
+  )
 
-def html_list(results):
-  """Function to return the database connection object.
+# Read replica, which serves the lists, searches and exports if set. Either
+# a full database URL, or the port of another Cloud SQL proxy connected to
+# the replica
+db_read_url = os.getenv("DB_READ_URL")
+db_read_port = os.getenv("DB_READ_PORT")
+
+if db_read_url:
+  read_pool = sqlalchemy.create_engine(db_read_url, **pool_settings)
+elif db_read_port:
+  read_pool = sqlalchemy.create_engine(
+      sqlalchemy.engine.url.URL.create(
+          drivername="mysql+pymysql",
+          username=db_user,
+          password=db_pass,
+          host="127.0.0.1",
+          port=db_read_port,
+          database="phonebook",
+      ),
+      **pool_settings,
+  )
+else:
+  read_pool = pool
+
+# Seconds during which a session reads from the primary after its own
+# writes, so that it sees them even if the replica lags behind
+READ_YOUR_WRITES_SECONDS = float(os.getenv("READ_YOUR_WRITES_SECONDS", "5"))
+
+# Cookie holding the time of the last write of a session
+WRITE_COOKIE = "phonebook_last_write"
+
+# Pool and statement metrics, served in the Prometheus format on /metrics
+metrics = [db_metrics.DatabaseMetrics(pool, prefix="phonebook_db")]
+if read_pool is not pool:
+  metrics.append(
+      db_metrics.DatabaseMetrics(read_pool, prefix="phonebook_db_replica"))
+
+TABLE_NAME = "phonebook_data"
+
+# Number of contacts listed on each page
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "50"))
+
+# Number of rows inserted with each statement and transaction by /import,
+# and read from the database for each chunk of /export
+CSV_BATCH_SIZE = int(os.getenv("CSV_BATCH_SIZE", "1000"))
+
+# Where the data version of the page cache is kept: "database", "local"
+# (only with a single replica) or "off" to disable the cache
+PAGE_CACHE = os.getenv("PAGE_CACHE", "database")
+
+# Maximum number of pages kept in the cache
+PAGE_CACHE_ENTRIES = int(os.getenv("PAGE_CACHE_ENTRIES", "256"))
+
+# Milliseconds the writer waits for more writes from /add and /delete to
+# commit together in one transaction. 0, the default, commits each write
+# in its own transaction
+GROUP_COMMIT_WINDOW_MS = float(os.getenv("GROUP_COMMIT_WINDOW_MS", "0"))
+
+# Maximum number of writes committed together
+GROUP_COMMIT_MAX_WRITES = int(os.getenv("GROUP_COMMIT_MAX_WRITES", "100"))
+
+# Media types of the CSV bodies accepted by /import
+CSV_MEDIA_TYPES = ("text/csv", "application/csv", "text/plain",
+                   "application/octet-stream")
+
+# Header rows of the CSV files, which are skipped when importing
+CSV_HEADERS = [["name", "phone_number"], ["name", "number"],
+               ["name", "phone number"]]
+
+# Table and statements prepared once, and reused by every request
+PhonebookSchema = collections.namedtuple(
+    "PhonebookSchema",
+    ["table", "first_page", "next_page", "previous_page", "search_name",
+     "search_number", "select_all", "insert", "delete", "select_version",
+     "bump_version"])
+
+schema = None
+schema_lock = threading.Lock()
+
+# Rendered pages, by cursor, with the data version they were rendered at
+page_cache = collections.OrderedDict()
+page_cache_lock = threading.Lock()
+local_version = 0
+
+
+def load_schema():
+  """Creates the phonebook table if needed and prepares its statements.
+
+  Call it again after the schema of the table was changed, to prepare the
+  statements again.
 
-  Args:
-    results: List of rows containing phonebook entries.
   Returns:
-    HTML for the main page listing all phonebook entries.
+    PhonebookSchema with the table and the statements to use.
   """
-  html = """
+  with schema_lock:
+    return _prepare_schema()
+
+
+def _prepare_schema():
+  global schema
+  meta = sqlalchemy.MetaData()
+  table = sqlalchemy.Table(
+      TABLE_NAME, meta,
+      sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True),
+      sqlalchemy.Column("name", sqlalchemy.String(255)),
+      sqlalchemy.Column("phone_number", sqlalchemy.String(255)),
+      # Digits of the phone number, for searches
+      sqlalchemy.Column("normalized_number", sqlalchemy.String(255)),
+  )
+  indexes = [
+      sqlalchemy.Index("phonebook_data_name_idx", table.c.name, table.c.id),
+      sqlalchemy.Index("phonebook_data_number_idx",
+                       table.c.normalized_number, table.c.id),
+  ]
+  # Only creates what is missing. Columns and indexes are not created by
+  # create_all() when the table already exists
+  meta.create_all(pool)
+  columns = [column["name"] for column in
+             sqlalchemy.inspect(pool).get_columns(TABLE_NAME)]
+  if "normalized_number" not in columns:
+    _add_normalized_number(table)
+  for index in indexes:
+    index.create(pool, checkfirst=True)
+
+  # Single row table with the version of the data, for the page cache
+  version_table = sqlalchemy.Table(
+      TABLE_NAME + "_version", meta,
+      sqlalchemy.Column("id", sqlalchemy.Integer, primary_key=True,
+                        autoincrement=False),
+      sqlalchemy.Column("version", sqlalchemy.BigInteger, nullable=False),
+  )
+  if PAGE_CACHE == "database":
+    version_table.create(pool, checkfirst=True)
+    with pool.connect() as db_conn:
+      try:
+        db_conn.execute(
+            sqlalchemy.insert(version_table).values(id=1, version=0))
+        db_conn.commit()
+      except sqlalchemy.exc.IntegrityError:
+        # Created by another replica
+        db_conn.rollback()
+
+  # One more row than needed, to know if there is another page after it
+  select_page = sqlalchemy.select(
+      table.c.id, table.c.name, table.c.phone_number).limit(PAGE_SIZE + 1)
+  cursor_name = sqlalchemy.bindparam("cursor_name")
+  cursor_id = sqlalchemy.bindparam("cursor_id")
+  # The condition on the name alone lets the database seek in the index
+  schema = PhonebookSchema(
+      table=table,
+      first_page=select_page.order_by(table.c.name, table.c.id),
+      next_page=select_page.where(
+          table.c.name >= cursor_name,
+          sqlalchemy.or_(table.c.name > cursor_name,
+                         table.c.id > cursor_id),
+      ).order_by(table.c.name, table.c.id),
+      # Read backwards from the cursor, the rows are reversed afterwards
+      previous_page=select_page.where(
+          table.c.name <= cursor_name,
+          sqlalchemy.or_(table.c.name < cursor_name,
+                         table.c.id < cursor_id),
+      ).order_by(table.c.name.desc(), table.c.id.desc()),
+      search_name=_search_statement(table, table.c.name),
+      search_number=_search_statement(table, table.c.normalized_number),
+      select_all=sqlalchemy.select(
+          table.c.name, table.c.phone_number).order_by(
+              table.c.name, table.c.id),
+      insert=sqlalchemy.insert(table),
+      delete=sqlalchemy.delete(table).where(
+          table.c.id == sqlalchemy.bindparam("entry_id")),
+      select_version=sqlalchemy.select(version_table.c.version).where(
+          version_table.c.id == 1),
+      bump_version=sqlalchemy.update(version_table).where(
+          version_table.c.id == 1).values(
+              version=version_table.c.version + 1),
+  )
+  return schema
+
+
+def _add_normalized_number(table):
+  """Adds the normalized_number column to a table created without it."""
+  update_stmt = sqlalchemy.update(table).where(
+      table.c.id == sqlalchemy.bindparam("entry_id")).values(
+          normalized_number=sqlalchemy.bindparam("digits"))
+  with pool.connect() as db_conn:
+    db_conn.execute(sqlalchemy.text(
+        "ALTER TABLE {} ADD COLUMN normalized_number VARCHAR(255)".format(
+            TABLE_NAME)))
+    db_conn.commit()
+    # Fill it in batches, updated rows aren't selected again
+    select_stmt = sqlalchemy.select(table.c.id, table.c.phone_number).where(
+        table.c.normalized_number.is_(None)).limit(CSV_BATCH_SIZE)
+    rows = db_conn.execute(select_stmt).fetchall()
+    while rows:
+      db_conn.execute(update_stmt, [
+          {"entry_id": row[0], "digits": normalize_number(row[1])}
+          for row in rows])
+      db_conn.commit()
+      rows = db_conn.execute(select_stmt).fetchall()
+
+
+def _search_statement(table, column):
+  """Returns a page of the entries whose column starts with a prefix.
+
+  The rows are read from the index on (column, id), starting after the
+  cursor, which is the prefix itself and id 0 for the first page. The
+  prefix range is prefix <= column < prefix_end, so the read stops at the
+  end of the prefix even when it has few matches. The prefix is also
+  matched with LIKE 'prefix%', which keeps the results exact whatever the
+  collation of the column.
+  """
+  cursor_value = sqlalchemy.bindparam("cursor_value")
+  cursor_id = sqlalchemy.bindparam("cursor_id")
+  return sqlalchemy.select(
+      table.c.id, table.c.name, table.c.phone_number, column).where(
+          column >= cursor_value,
+          column < sqlalchemy.bindparam("prefix_end"),
+          column.like(sqlalchemy.bindparam("pattern"), escape="/"),
+          sqlalchemy.or_(column > cursor_value, table.c.id > cursor_id),
+      ).order_by(column, table.c.id).limit(PAGE_SIZE + 1)
+
+
+def get_schema():
+  """Returns the prepared schema, loading it on first use.
+
+  The schema isn't loaded on import, as the Cloud SQL proxy may not be
+  ready yet when the container starts.
+  """
+  if schema is None:
+    with schema_lock:
+      if schema is None:
+        _prepare_schema()
+  return schema
+
+
+def like_prefix(prefix):
+  """Returns the LIKE pattern of the values starting with a prefix."""
+  # Same escaping as startswith(autoescape=True), which needs the prefix
+  # when the statement is built
+  for character in "/%_":
+    prefix = prefix.replace(character, "/" + character)
+  return prefix + "%"
+
+
+def prefix_end(prefix):
+  """Returns a value sorting after all the values starting with a prefix."""
+  # U+10FFFF sorts last with a binary collation, and gets the highest
+  # implicit weight in the Unicode collations of MySQL, unlike the prefix
+  # with its last character incremented. Only values with this noncharacter
+  # right after the prefix are left out
+  return prefix + "\U0010ffff"
+
+
+def normalize_number(number):
+  """Returns the digits of a phone number, as searches use them."""
+  return re.sub(r"\D", "", number or "")
+
+
+def encode_cursor(value, entry_id):
+  """Returns the page cursor pointing to the sort value and id of a row."""
+  cursor = json.dumps([value, entry_id]).encode("utf-8")
+  return base64.urlsafe_b64encode(cursor).decode("ascii")
+
+
+def decode_cursor(cursor):
+  """Returns the (value, id) a page cursor points to, or None if invalid."""
+  try:
+    name, entry_id = json.loads(base64.urlsafe_b64decode(cursor))
+  except (ValueError, TypeError):
+    return None
+  if not isinstance(name, str) or not isinstance(entry_id, int):
+    return None
+  return name, entry_id
+
+
+LIST_HTML_TEMPLATE = """
   <HTML>
   <HEAD><TITLE>Phonebook running on GKE</TITLE></HEAD>
   <STYLE>
@@ -103,6 +437,10 @@ def html_list(results):
   }
   </STYLE>
   <BODY>
+  <FORM ACTION="/search" METHOD="GET">
+    <INPUT TYPE="text" NAME="q" PLACEHOLDER="Name or phone number">
+    <INPUT TYPE="submit" VALUE="Search">
+  </FORM>
   <H2>Phonebook entries:</H2>
   ###PHONEBOOK-LIST###
   <H2>Add new entry:</H2>
@@ -117,24 +455,73 @@ def html_list(results):
   </HTML>
   """
 
-  list_html = ""
-  if results:
-    list_html += "<TABLE>\n"
-    list_html += "<TR><TH>Name</TH><TH>Phone Number</TH><TH>Actions</TH></TR>"
-    for row in results:
-      row_html = "<TR>\n"
-      row_html += "<TD>{name}</TD>\n".format(name=row[1])
-      row_html += "<TD>{number}</TD>\n".format(number=row[2])
-      row_html += "<TD><FORM ACTION='/delete' METHOD='POST'>\n"
-      row_html += "<INPUT TYPE='hidden' NAME='id' VALUE='{id}'>\n".format(
-          id=row[0])
-      row_html += "<INPUT TYPE='submit' VALUE='Delete entry'>\n"
-      row_html += "</FORM></TD>\n"
-      row_html += "</TD>\n"
-      row_html += "</TR>\n"
-      list_html += row_html
-    list_html += "</TABLE>\n"
-  return html.replace("###PHONEBOOK-LIST###", list_html)
+# Parts of the main page before and after the list of entries
+LIST_HTML_HEAD, LIST_HTML_TAIL = LIST_HTML_TEMPLATE.split(
+    "###PHONEBOOK-LIST###")
+
+
+def html_row(row):
+  """Returns the HTML of the table row of a phonebook entry."""
+  row_html = "<TR>\n"
+  row_html += "<TD>{name}</TD>\n".format(name=row[1])
+  row_html += "<TD>{number}</TD>\n".format(number=row[2])
+  row_html += "<TD><FORM ACTION='/delete' METHOD='POST'>\n"
+  row_html += "<INPUT TYPE='hidden' NAME='id' VALUE='{id}'>\n".format(
+      id=row[0])
+  row_html += "<INPUT TYPE='submit' VALUE='Delete entry'>\n"
+  row_html += "</FORM></TD>\n"
+  row_html += "</TD>\n"
+  row_html += "</TR>\n"
+  return row_html
+
+
+def html_list_chunks(results, page_links=None):
+  """Yields the HTML for the main page, one table row at a time.
+
+  Args:
+    results: Iterable over the rows containing phonebook entries, which
+      is only read as the chunks are consumed.
+    page_links: Function returning the links to the previous and next
+      pages, or None. It is called once all the rows have been read.
+  Returns:
+    Iterator over the chunks of HTML for the main page.
+  """
+  yield LIST_HTML_HEAD
+  rows = iter(results)
+  first_row = next(rows, None)
+  if first_row is not None:
+    yield ("<TABLE>\n"
+           "<TR><TH>Name</TH><TH>Phone Number</TH><TH>Actions</TH></TR>")
+    yield html_row(first_row)
+    for row in rows:
+      yield html_row(row)
+    yield "</TABLE>\n"
+  previous_link, next_link = page_links() if page_links else (None, None)
+  if previous_link:
+    yield "<A HREF='{link}'>Previous page</A>\n".format(link=previous_link)
+  if next_link:
+    yield "<A HREF='{link}'>Next page</A>\n".format(link=next_link)
+  yield LIST_HTML_TAIL
+
+
+def html_list(results, previous_cursor=None, next_cursor=None):
+  """Function to return the database connection object.
+
+  Args:
+    results: List of rows containing phonebook entries.
+    previous_cursor: Cursor of the previous page, if there is one.
+    next_cursor: Cursor of the next page, if there is one.
+  Returns:
+    HTML for the main page listing all phonebook entries.
+  """
+  return "".join(html_list_chunks(
+      results, lambda: page_links(previous_cursor, next_cursor)))
+
+
+def page_links(previous_cursor, next_cursor):
+  """Returns the links to the pages of the main page list at two cursors."""
+  return (previous_cursor and "/?before=" + previous_cursor,
+          next_cursor and "/?after=" + next_cursor)
 
 
 def html_ok(message):
@@ -147,74 +534,351 @@ def html_error(message):
   return html.replace("###MESSAGE###", message)
 
 app = Flask(__name__)
+app.logger.setLevel(logging.INFO)
 
 
-def print_phonebook():
-  """Function to return the database connection object.
+def cached_page(key, version):
+  """Returns a page rendered at a data version, or None if not cached."""
+  with page_cache_lock:
+    cached = page_cache.get(key)
+    if cached is None or cached[0] != version:
+      return None
+    page_cache.move_to_end(key)
+    return cached[1]
+
+
+def store_page(key, version, html):
+  """Caches a page rendered at a data version, evicting the oldest one."""
+  with page_cache_lock:
+    page_cache[key] = (version, html)
+    page_cache.move_to_end(key)
+    while len(page_cache) > PAGE_CACHE_ENTRIES:
+      page_cache.popitem(last=False)
+
+
+def commit_changes(db_conn):
+  """Commits a write to the phonebook, with a new data version.
+
+  Args:
+    db_conn: Connection with the uncommitted changes.
+  """
+  global local_version
+  if PAGE_CACHE == "database":
+    # In the same transaction, so readers never see the new version before
+    # the new data
+    db_conn.execute(get_schema().bump_version)
+  db_conn.commit()
+  with page_cache_lock:
+    local_version += 1
+
 
+group_committer = None
+if GROUP_COMMIT_WINDOW_MS > 0:
+  group_committer = group_commit.GroupCommitter(
+      pool, commit_changes, GROUP_COMMIT_WINDOW_MS / 1000,
+      GROUP_COMMIT_MAX_WRITES)
+
+
+def write_changes(operation):
+  """Runs a write to the phonebook and commits it.
+
+  Args:
+    operation: Function running the write, called with the connection.
   Returns:
-    HTML of the list containing all entries in the phonebook.
+    The return value of operation.
   """
+  if group_committer is not None:
+    # Committed with the concurrent writes
+    return group_committer.submit(operation)
   # connect to connection pool
   with pool.connect() as db_conn:
-    # create phonebook data table if it doesn't exist
-    if not sqlalchemy.inspect(pool).has_table("phonebook_data"):
-        meta = sqlalchemy.MetaData()
-        Phonebook = sqlalchemy.Table(
-            "phonebook_data", meta, 
-            sqlalchemy.Column("id", sqlalchemy.Integer, primary_key = True), 
-            sqlalchemy.Column("name", sqlalchemy.String(255)), 
-            sqlalchemy.Column("phone_number", sqlalchemy.String(255)),
-        )
-        meta.create_all(pool)
-
-    # Prepare reference to existing table
-    Base = automap_base()
-    Base.prepare(pool, reflect=True)
-    Phonebook = Base.classes.phonebook_data
-    # query and fetch ratings table
-    select_stmt = sqlalchemy.select(Phonebook)
-    results = db_conn.execute(select_stmt).fetchall()
-    return html_list(results)
+    result = operation(db_conn)
+    commit_changes(db_conn)
+  return result
 
 
-def add_entry(new_name, new_number):
-  # Prepare reference to existing table
-  Base = automap_base()
-  Base.prepare(pool, reflect=True)
-  Phonebook = Base.classes.phonebook_data
+def print_phonebook(after=None, before=None, db_pool=None):
+  """Function to return the database connection object.
+
+  The query runs before returning, so that database errors are still
+  reported with an error status, but the rows are only read from a server
+  side cursor as the page is sent.
+
+  Args:
+    after: Cursor of the last entry of the previous page.
+    before: Cursor of the first entry of the next page.
+    db_pool: Engine to read from, the read replica by default.
+  Returns:
+    Iterator over the chunks of HTML of the list containing a page of
+    entries in the phonebook. Closing it releases the connection.
+    Cached pages are returned in a single chunk.
+  """
+  phonebook = get_schema()
+  after = after and decode_cursor(after)
+  before = before and decode_cursor(before)
+  if after:
+    select_stmt = phonebook.next_page
+    params = {"cursor_name": after[0], "cursor_id": after[1]}
+  elif before:
+    select_stmt = phonebook.previous_page
+    params = {"cursor_name": before[0], "cursor_id": before[1]}
+  else:
+    select_stmt, params = phonebook.first_page, {}
+
+  db_pool = db_pool or read_pool
+  cache_key = (after, before)
+  version = None
+  # The local version counts the writes of this replica to the primary,
+  # which a lagging read replica may not have yet
+  if PAGE_CACHE == "local" and db_pool is pool:
+    version = local_version
+    html = cached_page(cache_key, version)
+    if html is not None:
+      return ClosingIterator([html])
+
   # connect to connection pool
-  with pool.connect() as db_conn:
-    # insert data into our phonebook table
-    insert_stmt = (
-      sqlalchemy.insert(Phonebook).
-      values(name=new_name, phone_number=new_number)
-    )    
-    # insert entries into table
-    db_conn.execute(insert_stmt)
-    db_conn.commit()
+  db_conn = db_pool.connect()
+  try:
+    if PAGE_CACHE == "database":
+      # Read in the same transaction as the page, so that both match. Pages
+      # read from the primary and from the replica share the cache, as the
+      # version is replicated with the data it belongs to
+      version = db_conn.execute(phonebook.select_version).scalar()
+      html = cached_page(cache_key, version)
+      if html is not None:
+        db_conn.close()
+        return ClosingIterator([html])
+    # query a page of the phonebook table
+    result = db_conn.execution_options(stream_results=True).execute(
+        select_stmt, params)
+  except Exception:
+    db_conn.close()
+    raise
+
+  page = {"first": None, "last": None, "more": False}
+
+  def page_rows():
+    if before:
+      # Read backwards, so the page is reversed, it has PAGE_SIZE rows
+      rows = result.fetchmany(PAGE_SIZE + 1)
+      page["more"] = len(rows) > PAGE_SIZE
+      rows = rows[PAGE_SIZE - 1::-1]
+    else:
+      rows = result
+    for count, row in enumerate(rows):
+      if count == PAGE_SIZE:
+        page["more"] = True
+        break
+      if page["first"] is None:
+        page["first"] = row
+      page["last"] = row
+      yield row
+    result.close()
+
+  def cursor_links():
+    previous_cursor = next_cursor = None
+    if page["first"] is not None:
+      # Coming from a page means that there are entries on that side
+      if after or before and page["more"]:
+        previous_cursor = encode_cursor(page["first"][1], page["first"][0])
+      if before or page["more"]:
+        next_cursor = encode_cursor(page["last"][1], page["last"][0])
+    return page_links(previous_cursor, next_cursor)
+
+  def cached_chunks(chunks):
+    # Cache the page once it was fully sent
+    sent = []
+    for chunk in chunks:
+      sent.append(chunk)
+      yield chunk
+    store_page(cache_key, version, "".join(sent))
+
+  chunks = html_list_chunks(page_rows(), cursor_links)
+  if version is not None:
+    chunks = cached_chunks(chunks)
+  return ClosingIterator(chunks, db_conn.close)
+
+
+def add_entry(new_name, new_number):
+  phonebook = get_schema()
+  params = {"name": new_name, "phone_number": new_number,
+            "normalized_number": normalize_number(new_number)}
+  # insert data into our phonebook table
+  write_changes(lambda db_conn: db_conn.execute(phonebook.insert, params))
 
 
 def delete_entry(entry_id):
-  # Prepare reference to existing table
-  Base = automap_base()
-  Base.prepare(pool, reflect=True)
-  Phonebook = Base.classes.phonebook_data
-  # connect to connection pool
+  phonebook = get_schema()
+  params = {"entry_id": int(entry_id)}
+  # delete entry from our phonebook table
+  write_changes(lambda db_conn: db_conn.execute(phonebook.delete, params))
+
+
+def search_entries(query, after=None, db_pool=None):
+  """Finds the entries whose name or phone number starts with a query.
+
+  Queries made of digits and phone number punctuation only are searched
+  for in the phone numbers, ignoring punctuation, other ones in the names.
+
+  Args:
+    query: Start of the names or phone numbers to find.
+    after: Cursor of the last entry of the previous page of results.
+    db_pool: Engine to read from, the read replica by default.
+  Returns:
+    List of at most PAGE_SIZE matching entries, ordered by the searched
+    field, and the cursor of the next page, or None if it is the last.
+  """
+  phonebook = get_schema()
+  digits = normalize_number(query)
+  if digits and re.fullmatch(r"[\d\s+().-]+", query):
+    select_stmt, prefix = phonebook.search_number, digits
+  else:
+    select_stmt, prefix = phonebook.search_name, query
+  # The pattern keeps the results in the prefix, whatever the cursor. It
+  # can't be checked against the prefix here, as the database may compare
+  # them ignoring case or accents
+  cursor = after and decode_cursor(after) or (prefix, 0)
+  with (db_pool or read_pool).connect() as db_conn:
+    results = db_conn.execute(select_stmt, {
+        "cursor_value": cursor[0],
+        "cursor_id": cursor[1],
+        "prefix_end": prefix_end(prefix),
+        "pattern": like_prefix(prefix),
+    }).fetchall()
+  next_cursor = None
+  if len(results) > PAGE_SIZE:
+    results = results[:PAGE_SIZE]
+    next_cursor = encode_cursor(results[-1][3], results[-1][0])
+  return results, next_cursor
+
+
+class ImportFailed(Exception):
+  """The CSV file could not be read after some of its entries were imported."""
+
+  def __init__(self, imported, error):
+    super().__init__(error)
+    self.imported = imported
+
+
+def import_entries(lines):
+  """Adds the entries of a CSV file to the phonebook.
+
+  The file is read and inserted in batches of CSV_BATCH_SIZE rows, each
+  batch with a single multi-row insert and commit. Rows without a name or
+  number are skipped.
+
+  Args:
+    lines: Iterable over the lines of the CSV file, with name and number
+      columns.
+  Returns:
+    The number of entries imported, and the number of rows skipped.
+  Raises:
+    ImportFailed: if the file isn't a UTF-8 CSV file. The batches read
+      before the error stay imported, its imported attribute counts them.
+  """
+  phonebook = get_schema()
+  imported = skipped = 0
+  batch = []
   with pool.connect() as db_conn:
-    # delete entry from our phonebook table
-    delete_stmt = (
-        sqlalchemy.delete(Phonebook).
-        where(Phonebook.id == entry_id)
-    )
-    # insert entries into table
-    db_conn.execute(delete_stmt)
-    db_conn.commit()
+    try:
+      for row in csv.reader(lines):
+        if not row or [value.strip().lower() for value in row] in CSV_HEADERS:
+          continue
+        if len(row) < 2 or not row[0].strip() or not row[1].strip():
+          skipped += 1
+          continue
+        batch.append({"name": row[0].strip(),
+                      "phone_number": row[1].strip(),
+                      "normalized_number": normalize_number(row[1])})
+        if len(batch) == CSV_BATCH_SIZE:
+          # Executed as one multi-row INSERT by the MySQL driver
+          db_conn.execute(phonebook.insert, batch)
+          commit_changes(db_conn)
+          imported += len(batch)
+          batch = []
+    except (UnicodeDecodeError, csv.Error) as error:
+      raise ImportFailed(imported, error)
+    if batch:
+      db_conn.execute(phonebook.insert, batch)
+      commit_changes(db_conn)
+      imported += len(batch)
+  return imported, skipped
+
+
+def export_entries(db_pool=None):
+  """Returns the phonebook as a CSV file, read as it is sent.
+
+  Args:
+    db_pool: Engine to read from, the read replica by default.
+  Returns:
+    Iterator over the chunks of the CSV file, each with up to
+    CSV_BATCH_SIZE entries. Closing it releases the connection.
+  """
+  phonebook = get_schema()
+  db_conn = (db_pool or read_pool).connect()
+  try:
+    result = db_conn.execution_options(
+        stream_results=True, yield_per=CSV_BATCH_SIZE).execute(
+            phonebook.select_all)
+  except Exception:
+    db_conn.close()
+    raise
+
+  def csv_chunks():
+    start = time.perf_counter()
+    exported = 0
+    buffer = io.StringIO()
+    writer = csv.writer(buffer)
+    writer.writerow(["name", "phone_number"])
+    for rows in result.partitions():
+      writer.writerows(rows)
+      exported += len(rows)
+      yield buffer.getvalue()
+      buffer.seek(0)
+      buffer.truncate()
+    yield buffer.getvalue()
+    elapsed = time.perf_counter() - start
+    app.logger.info("Exported %d entries in %.2f s (%.0f rows/s)", exported,
+                    elapsed, exported / elapsed if elapsed else 0)
+
+  return ClosingIterator(csv_chunks(), db_conn.close)
+
+def request_read_pool():
+  """Returns the engine to read from for the session of the request.
+
+  Sessions that wrote in the last READ_YOUR_WRITES_SECONDS read from the
+  primary, the other ones from the read replica.
+  """
+  if read_pool is pool:
+    return pool
+  try:
+    last_write = float(request.cookies.get(WRITE_COOKIE, ""))
+  except ValueError:
+    return read_pool
+  if time.time() - last_write < READ_YOUR_WRITES_SECONDS:
+    return pool
+  return read_pool
+
+
+def remember_write():
+  """Sends the session to the primary for its next reads."""
+  if read_pool is pool:
+    return
+
+  @after_this_request
+  def set_write_cookie(response):
+    response.set_cookie(WRITE_COOKIE, repr(time.time()),
+                        max_age=math.ceil(READ_YOUR_WRITES_SECONDS),
+                        httponly=True)
+    return response
+
 
 @app.route("/")
 def print_phonebook_worker():
-  content = print_phonebook()
-  return(content)
+  content = print_phonebook(
+      request.args.get("after"), request.args.get("before"),
+      request_read_pool())
+  return Response(content, mimetype="text/html")
 
 
 @app.route("/add", methods=["POST"])
@@ -223,6 +887,7 @@ def add_entry_worker():
   new_number = request.values.get("number")
   if new_name and new_number:
     add_entry(new_name, new_number)
+    remember_write()
     return html_ok("Entry was successfully added")
   else:
     return html_error("You must specify a name and a number")
@@ -233,9 +898,76 @@ def delete_entry_worker():
   entry_id = request.values.get("id")
   if entry_id and entry_id.isdigit():
     delete_entry(entry_id)
+    remember_write()
     return html_ok("Entry was successfully deleted")
   else:
     return html_error("You must specify a valid entry ID to delete")
 
+
+@app.route("/search")
+def search_entries_worker():
+  query = request.args.get("q", "").strip()
+  if not query:
+    return html_error("You must specify the start of a name or number")
+  results, next_cursor = search_entries(
+      query, request.args.get("after"), request_read_pool())
+  next_link = next_cursor and "/search?" + urllib.parse.urlencode(
+      {"q": query, "after": next_cursor})
+  return "".join(html_list_chunks(results, lambda: (None, next_link)))
+
+
+@app.route("/import", methods=["POST"])
+def import_entries_worker():
+  # Either a file field of a form, or a CSV body. Other bodies, such as
+  # forms sent by curl --data-binary without a Content-Type, would be
+  # consumed by the form parser and import nothing
+  if request.mimetype == "multipart/form-data":
+    upload = request.files.get("file")
+    if upload is None:
+      return html_error("You must upload the CSV file in a file field")
+    stream = upload.stream
+  elif request.mimetype in CSV_MEDIA_TYPES:
+    stream = request.stream
+  else:
+    return html_error("The body must be a CSV file sent as text/csv, or a "
+                      "form with a file field")
+  lines = io.TextIOWrapper(stream, encoding="utf-8", newline="")
+  start = time.perf_counter()
+  try:
+    imported, skipped = import_entries(lines)
+  except ImportFailed as error:
+    app.logger.info("Import failed after %d entries: %s",
+                    error.imported, error)
+    if not error.imported:
+      return html_error("The file must be a UTF-8 CSV file")
+    remember_write()
+    return html_error(
+        "The file must be a UTF-8 CSV file. The first {} entries were "
+        "imported, the following ones were not".format(error.imported))
+  remember_write()
+  elapsed = time.perf_counter() - start
+  message = "Imported {} entries in {:.2f} s ({:.0f} rows/s)".format(
+      imported, elapsed, imported / elapsed if elapsed else 0)
+  app.logger.info(message)
+  if skipped:
+    message += ", skipped {} rows without a name or number".format(skipped)
+  return html_ok(message)
+
+
+@app.route("/export")
+def export_entries_worker():
+  response = Response(export_entries(request_read_pool()),
+                      mimetype="text/csv")
+  response.headers["Content-Disposition"] = (
+      'attachment; filename="phonebook.csv"')
+  return response
+
+
+@app.route("/metrics")
+def metrics_worker():
+  return Response("".join(engine_metrics.render()
+                          for engine_metrics in metrics),
+                  mimetype="text/plain; version=0.0.4")
+
 if __name__ == "__main__":
   app.run(debug=True, host="0.0.0.0", port=int(os.environ.get("PORT", 8080)))
@@ -0,0 +1,91 @@
+#!/usr/bin/env python
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Measures the write throughput of the phonebook with group commit.
+
+Adds, then deletes, contacts from concurrent threads with app.py, once
+committing each write in its own transaction and then with group commit
+windows, and checks that every write was applied. Runs against a
+temporary SQLite database, or any database given with --db-url, such as a
+local MySQL or MariaDB server. --commit-delay-ms adds a delay to every
+commit, standing in for the round trip through the Cloud SQL proxy.
+
+Usage: python benchmark_group_commit.py [--db-url URL] [--commit-delay-ms 2]
+"""
+import argparse
+import concurrent.futures
+import os
+import tempfile
+import time
+
+import sqlalchemy
+
+
+def run_writes(app, operation, arguments, threads):
+  """Runs the writes from concurrent threads, returns the writes/s."""
+  start = time.perf_counter()
+  with concurrent.futures.ThreadPoolExecutor(threads) as executor:
+    # Raises the first error of the writes
+    list(executor.map(operation, arguments))
+  return len(arguments) / (time.perf_counter() - start)
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument("--db-url")
+  parser.add_argument("--commit-delay-ms", type=float, default=0)
+  parser.add_argument("--threads", type=int, default=32)
+  parser.add_argument("--writes", type=int, default=2000)
+  parser.add_argument("--windows", default="0,1,2,5",
+                      type=lambda value: [float(v) for v in value.split(",")],
+                      help="Group commit windows in ms, 0 to disable it")
+  args = parser.parse_args()
+
+  os.environ["DB_URL"] = args.db_url or "sqlite:///" + os.path.join(
+      tempfile.mkdtemp(), "phonebook.db")
+  # The pool isn't what limits the writes
+  os.environ["DB_POOL_SIZE"] = str(args.threads + 1)
+  import app  # pylint: disable=import-outside-toplevel
+  import group_commit  # pylint: disable=import-outside-toplevel
+
+  if args.commit_delay_ms:
+    sqlalchemy.event.listen(
+        app.pool, "commit",
+        lambda conn: time.sleep(args.commit_delay_ms / 1000))
+  table = app.get_schema().table
+
+  print("{:>10} {:>14} {:>14}".format("window ms", "adds/s", "deletes/s"))
+  for window in args.windows:
+    app.group_committer = window and group_commit.GroupCommitter(
+        app.pool, app.commit_changes, window / 1000,
+        app.GROUP_COMMIT_MAX_WRITES) or None
+    names = ["Group {:g} {:06d}".format(window, index)
+             for index in range(args.writes)]
+    adds = run_writes(
+        app, lambda name: app.add_entry(name, "+1 555 0100"), names,
+        args.threads)
+    with app.pool.connect() as db_conn:
+      ids = db_conn.execute(sqlalchemy.select(table.c.id).where(
+          table.c.name.in_(names))).scalars().all()
+    assert len(ids) == args.writes, "Missing additions"
+    deletes = run_writes(app, app.delete_entry, ids, args.threads)
+    with app.pool.connect() as db_conn:
+      left = db_conn.execute(sqlalchemy.select(
+          sqlalchemy.func.count()).where(table.c.id.in_(ids))).scalar()
+    assert left == 0, "Missing deletions"
+    print("{:>10g} {:>14.0f} {:>14.0f}".format(window, adds, deletes))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,233 @@
+#!/usr/bin/env python
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Load test of the phonebook app, without Cloud SQL.
+
+Seeds a phonebook with a number of contacts, then sends a random mix of
+list, search, add and delete requests through the Flask app from
+concurrent clients, at each concurrency level. Reports the requests per
+second, the latency percentiles and the SQL statements per request of
+each operation. Runs against a temporary SQLite database, or any database
+given with --db-url, such as a local MySQL container:
+
+  docker run -d -p 3306:3306 -e MYSQL_ROOT_PASSWORD=pw \\
+      -e MYSQL_DATABASE=phonebook mysql:8
+  python benchmark_load.py \\
+      --db-url mysql+pymysql://root:pw@127.0.0.1:3306/phonebook
+
+The settings of app.py, such as PAGE_CACHE or GROUP_COMMIT_WINDOW_MS, are
+read from the environment as usual. Results can be saved as JSON with
+--output, to compare the effect of a change.
+"""
+import argparse
+import concurrent.futures
+import json
+import os
+import random
+import statistics
+import tempfile
+import threading
+import time
+
+import sqlalchemy
+
+FIRST_NAMES = ["Ada", "Alan", "Barbara", "Dennis", "Edsger", "Frances",
+               "Grace", "John", "Ken", "Margaret", "Radia", "Tim"]
+OPERATIONS = ("list", "search", "add", "delete")
+
+
+def parse_mix(value):
+  """Parses weights such as list=80,add=10,delete=10."""
+  mix = {}
+  for item in value.split(","):
+    operation, weight = item.split("=")
+    if operation not in OPERATIONS:
+      raise argparse.ArgumentTypeError("Unknown operation " + operation)
+    mix[operation] = float(weight)
+  return mix
+
+
+class Workload(object):
+  """Random requests of the mix, on the seeded contacts."""
+
+  def __init__(self, app, mix, seed):
+    self.app = app
+    self.operations = list(mix)
+    self.weights = [mix[operation] for operation in self.operations]
+    self.random = random.Random(seed)
+    self.lock = threading.Lock()
+    table = app.get_schema().table
+    with app.pool.connect() as db_conn:
+      self.rows = db_conn.execute(
+          sqlalchemy.select(table.c.id, table.c.name)).fetchall()
+    self.random.shuffle(self.rows)
+    self.added = 0
+
+  def next_request(self):
+    """Returns the operation, method, path and form of a request."""
+    with self.lock:
+      operation = self.random.choices(self.operations, self.weights)[0]
+      if operation == "list":
+        # A random page of the list, or the first one
+        if not self.rows or self.random.random() < 0.2:
+          return operation, "GET", "/", None
+        entry_id, name = self.random.choice(self.rows)
+        return operation, "GET", "/?after=" + self.app.encode_cursor(
+            name, entry_id), None
+      if operation == "search":
+        return operation, "GET", "/search?q=" + self.random.choice(
+            FIRST_NAMES), None
+      if operation == "add":
+        self.added += 1
+        return operation, "POST", "/add", {
+            "name": "{} Load {:07d}".format(
+                self.random.choice(FIRST_NAMES), self.added),
+            "number": "+1 555 {:07d}".format(self.added)}
+      # Each seeded contact is deleted once, then deletes miss
+      entry_id = self.rows.pop()[0] if self.rows else 0
+      return operation, "POST", "/delete", {"id": str(entry_id)}
+
+
+def seed(app, contacts):
+  """Fills the phonebook with a number of contacts."""
+  lines = ("{} {:07d},+1 (555) {:03d}-{:04d}\n".format(
+      FIRST_NAMES[index % len(FIRST_NAMES)], index, index // 10000 % 1000,
+      index % 10000) for index in range(contacts))
+  start = time.perf_counter()
+  imported, _ = app.import_entries(lines)
+  print("Seeded {} contacts in {:.1f} s".format(
+      imported, time.perf_counter() - start))
+
+
+def run_level(app, workload, requests, concurrency):
+  """Sends the requests from concurrent clients, returns the results."""
+  local = threading.local()
+
+  def count_statement(*args):
+    local.statements = getattr(local, "statements", 0) + 1
+
+  engines = {app.pool, app.read_pool}
+  for engine in engines:
+    sqlalchemy.event.listen(engine, "before_cursor_execute", count_statement)
+
+  def send(_):
+    if not hasattr(local, "client"):
+      local.client = app.app.test_client()
+    operation, method, path, form = workload.next_request()
+    local.statements = 0
+    start = time.perf_counter()
+    response = local.client.open(path, method=method, data=form)
+    response.get_data()
+    response.close()
+    return (operation, time.perf_counter() - start, local.statements,
+            response.status_code)
+
+  try:
+    start = time.perf_counter()
+    with concurrent.futures.ThreadPoolExecutor(concurrency) as executor:
+      results = list(executor.map(send, range(requests)))
+    elapsed = time.perf_counter() - start
+  finally:
+    for engine in engines:
+      sqlalchemy.event.remove(engine, "before_cursor_execute",
+                              count_statement)
+
+  level = {"concurrency": concurrency, "operations": {}}
+  for operation in ["all"] + list(OPERATIONS):
+    runs = [result for result in results
+            if operation in ("all", result[0])]
+    if not runs:
+      continue
+    latencies = sorted(latency for _, latency, _, _ in runs)
+    quantiles = (statistics.quantiles(latencies, n=100)
+                 if len(latencies) > 1 else latencies * 99)
+    level["operations"][operation] = {
+        "requests": len(runs),
+        "errors": sum(1 for _, _, _, status in runs if status != 200),
+        "requests_per_s": len(runs) / elapsed,
+        "latency_ms": {"p50": quantiles[49] * 1000,
+                       "p95": quantiles[94] * 1000,
+                       "p99": quantiles[98] * 1000},
+        # Statements run by the request's own thread, without those of the
+        # group commit writer
+        "statements_per_request": statistics.mean(
+            statements for _, _, statements, _ in runs),
+    }
+  return level
+
+
+def main():
+  parser = argparse.ArgumentParser(
+      description=__doc__.splitlines()[0],
+      formatter_class=argparse.RawDescriptionHelpFormatter, epilog=__doc__)
+  parser.add_argument("--db-url", help="Temporary SQLite database if unset")
+  parser.add_argument("--contacts", type=int, default=10000,
+                      help="Contacts seeded before the load test")
+  parser.add_argument("--requests", type=int, default=2000,
+                      help="Requests sent at each concurrency level")
+  parser.add_argument("--concurrency", default="1,8,32",
+                      type=lambda value: [int(v) for v in value.split(",")])
+  parser.add_argument("--mix", type=parse_mix,
+                      default=parse_mix("list=70,search=10,add=10,delete=10"))
+  parser.add_argument("--seed", type=int, default=0,
+                      help="Seed of the random requests")
+  parser.add_argument("--output", help="File to write the results to")
+  args = parser.parse_args()
+
+  os.environ["DB_URL"] = args.db_url or "sqlite:///" + os.path.join(
+      tempfile.mkdtemp(), "phonebook.db")
+  # The pool isn't what limits the load, unless set otherwise
+  os.environ.setdefault("DB_POOL_SIZE", str(max(args.concurrency) + 1))
+  import app  # pylint: disable=import-outside-toplevel
+
+  app.load_schema()
+  seed(app, args.contacts)
+  workload = Workload(app, args.mix, args.seed)
+  # Warm up the pool and the page cache
+  run_level(app, workload, min(100, args.requests), 1)
+
+  levels = []
+  print("{:>5} {:<7} {:>8} {:>6} {:>10} {:>9} {:>9} {:>9} {:>7}".format(
+      "conc", "op", "requests", "errors", "req/s", "p50 ms", "p95 ms",
+      "p99 ms", "stmts"))
+  for concurrency in args.concurrency:
+    level = run_level(app, workload, args.requests, concurrency)
+    levels.append(level)
+    for operation, stats in level["operations"].items():
+      print("{:>5} {:<7} {:>8} {:>6} {:>10.1f} {:>9.2f} {:>9.2f} {:>9.2f} "
+            "{:>7.2f}".format(
+                concurrency, operation, stats["requests"], stats["errors"],
+                stats["requests_per_s"], stats["latency_ms"]["p50"],
+                stats["latency_ms"]["p95"], stats["latency_ms"]["p99"],
+                stats["statements_per_request"]))
+
+  if args.output:
+    with open(args.output, "w") as output:
+      json.dump({
+          "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+          "settings": {
+              "database": sqlalchemy.engine.make_url(
+                  os.environ["DB_URL"]).get_backend_name(),
+              "contacts": args.contacts,
+              "requests": args.requests,
+              "mix": args.mix,
+              "page_cache": app.PAGE_CACHE,
+              "group_commit_window_ms": app.GROUP_COMMIT_WINDOW_MS,
+          },
+          "levels": levels,
+      }, output, indent=2)
+
+
+if __name__ == "__main__":
+  main()
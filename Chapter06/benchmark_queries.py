@@ -0,0 +1,124 @@
+#!/usr/bin/env python
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Counts the database queries run by each phonebook operation.
+
+Runs the operations against a temporary SQLite database, first reflecting
+the schema on every call as the phonebook used to do, then with the
+statements prepared once by app.py, and prints the number of SQL
+statements each one sends to the database.
+
+Usage: python benchmark_queries.py [iterations]
+"""
+import os
+import sys
+import tempfile
+
+import sqlalchemy
+from sqlalchemy.ext.automap import automap_base
+
+database_dir = tempfile.mkdtemp()
+os.environ["DB_URL"] = "sqlite:///" + os.path.join(database_dir, "phonebook.db")
+# Count the queries of every page view, not of the cached pages
+os.environ["PAGE_CACHE"] = "off"
+
+import app  # pylint: disable=wrong-import-position
+
+
+def reflect_phonebook():
+  """Reflects the phonebook table, as every operation used to."""
+  Base = automap_base()
+  Base.prepare(autoload_with=app.pool)
+  return Base.classes.phonebook_data
+
+
+def print_phonebook_reflected():
+  with app.pool.connect() as db_conn:
+    if not sqlalchemy.inspect(app.pool).has_table(app.TABLE_NAME):
+      app.load_schema()
+    Phonebook = reflect_phonebook()
+    results = db_conn.execute(sqlalchemy.select(Phonebook)).fetchall()
+    return app.html_list(results)
+
+
+def add_entry_reflected(new_name, new_number):
+  Phonebook = reflect_phonebook()
+  with app.pool.connect() as db_conn:
+    db_conn.execute(sqlalchemy.insert(Phonebook).values(
+        name=new_name, phone_number=new_number))
+    db_conn.commit()
+
+
+def delete_entry_reflected(entry_id):
+  Phonebook = reflect_phonebook()
+  with app.pool.connect() as db_conn:
+    db_conn.execute(
+        sqlalchemy.delete(Phonebook).where(Phonebook.id == entry_id))
+    db_conn.commit()
+
+
+def print_phonebook():
+  chunks = app.print_phonebook()
+  try:
+    return "".join(chunks)
+  finally:
+    chunks.close()
+
+
+class QueryCounter(object):
+  """Counts the statements sent through the connection pool."""
+
+  def __init__(self):
+    self.count = 0
+    sqlalchemy.event.listen(app.pool, "before_cursor_execute", self._count)
+
+  def _count(self, *args):
+    self.count += 1
+
+  def measure(self, operation, iterations):
+    """Returns the average number of statements run by an operation."""
+    start = self.count
+    for index in range(iterations):
+      operation(index)
+    return (self.count - start) / iterations
+
+
+def main():
+  iterations = int(sys.argv[1]) if len(sys.argv) > 1 else 20
+  counter = QueryCounter()
+  app.load_schema()
+  before = [
+      counter.measure(
+          lambda i: add_entry_reflected("Name %d" % i, "555-%04d" % i),
+          iterations),
+      counter.measure(lambda i: print_phonebook_reflected(), iterations),
+      counter.measure(lambda i: delete_entry_reflected(i + 1), iterations),
+  ]
+  after = [
+      counter.measure(
+          lambda i: app.add_entry("Name %d" % i, "555-%04d" % i),
+          iterations),
+      counter.measure(lambda i: print_phonebook(), iterations),
+      counter.measure(
+          lambda i: app.delete_entry(str(iterations + i + 1)), iterations),
+  ]
+  print("{:<12} {:>10} {:>10}".format("operation", "before", "after"))
+  for name, count_before, count_after in zip(
+      ["add", "list", "delete"], before, after):
+    print("{:<12} {:>10.1f} {:>10.1f}".format(name, count_before, count_after))
+  assert after == [1.0, 1.0, 1.0], "Expected a single query per operation"
+
+
+if __name__ == "__main__":
+  main()
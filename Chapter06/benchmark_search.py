@@ -0,0 +1,122 @@
+#!/usr/bin/env python
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Measures the latency of phonebook searches as the phonebook grows.
+
+Fills a temporary SQLite database with phonebooks of increasing sizes,
+and times prefix searches on names and phone numbers with app.py, which
+reads them from the indexes, and with a LIKE filter, which scans the
+table. The searches of app.py are timed for prefixes with many matches,
+with a single match, and without any, which must not read more of the
+index as the phonebook grows.
+
+Usage: python benchmark_search.py [size...]
+"""
+import os
+import random
+import sys
+import tempfile
+import timeit
+
+import sqlalchemy
+
+database_dir = tempfile.mkdtemp()
+os.environ["DB_URL"] = "sqlite:///" + os.path.join(database_dir, "phonebook.db")
+
+import app  # pylint: disable=wrong-import-position
+
+TABLE_SIZES = [10000, 100000, 1000000]
+SEARCHES = 200
+FIRST_NAMES = ["Ada", "Alan", "Barbara", "Dennis", "Edsger", "Frances",
+               "Grace", "John", "Ken", "Margaret", "Radia", "Tim"]
+
+
+def name(index):
+  return "{} {:07d}".format(FIRST_NAMES[index % len(FIRST_NAMES)], index)
+
+
+def number(index):
+  return "+1 (555) {:03d}-{:04d}".format(index // 10000, index % 10000)
+
+
+def fill_table(start, end):
+  phonebook = app.get_schema()
+  rows = []
+  with app.pool.connect() as db_conn:
+    for index in range(start, end):
+      rows.append({
+          "name": name(index),
+          "phone_number": number(index),
+          "normalized_number": app.normalize_number(number(index)),
+      })
+      if len(rows) == 10000:
+        db_conn.execute(phonebook.insert, rows)
+        rows = []
+    if rows:
+      db_conn.execute(phonebook.insert, rows)
+    db_conn.commit()
+
+
+def scan_search(column, prefix):
+  """Searches with LIKE, which SQLite can't answer from the index."""
+  table = app.get_schema().table
+  select_stmt = sqlalchemy.select(table).where(
+      column.like(prefix + "%")).order_by(column).limit(app.PAGE_SIZE + 1)
+  with app.pool.connect() as db_conn:
+    return db_conn.execute(select_stmt).fetchall()
+
+
+def main():
+  sizes = sorted(int(size) for size in sys.argv[1:]) or TABLE_SIZES
+  table = app.get_schema().table
+  print(("{:>9}" + " {:>13}" * 8).format(
+      "rows", "name (us)", "number (us)", "1 name", "1 number", "0 name",
+      "0 number", "name scan", "number scan"))
+  filled = 0
+  for size in sizes:
+    fill_table(filled, size)
+    filled = size
+    names = ["{} {:03d}".format(random.choice(FIRST_NAMES),
+                                random.randrange(size // 10000 + 1))
+             for _ in range(SEARCHES)]
+    numbers = ["+1 555 {:03d}".format(random.randrange(size // 10000 + 1))
+               for _ in range(SEARCHES)]
+    rare_names = [name(random.randrange(size)) for _ in range(SEARCHES)]
+    rare_numbers = [number(random.randrange(size)) for _ in range(SEARCHES)]
+    # Sorting after the names of a first name, and before all the numbers,
+    # so a read that doesn't stop at the end of the prefix goes on to the
+    # end of the index
+    absent_names = [random.choice(FIRST_NAMES) + " x"
+                    for _ in range(SEARCHES)]
+    absent_numbers = ["+1 554"] * SEARCHES
+    timings = []
+    for search, queries in (
+        (app.search_entries, names),
+        (app.search_entries, numbers),
+        (app.search_entries, rare_names),
+        (app.search_entries, rare_numbers),
+        (app.search_entries, absent_names),
+        (app.search_entries, absent_numbers),
+        (lambda query: scan_search(table.c.name, query), names),
+        (lambda query: scan_search(
+            table.c.normalized_number, app.normalize_number(query)),
+         numbers)):
+      queries = iter(queries)
+      timings.append(timeit.timeit(
+          lambda: search(next(queries)), number=SEARCHES) / SEARCHES)
+    print(("{:>9}" + " {:>13.1f}" * 8).format(
+        size, *[timing * 1e6 for timing in timings]))
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,114 @@
+#!/usr/bin/env python
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Compares building the phonebook page in memory with streaming it.
+
+Fills a temporary SQLite database with large phonebooks, and lists all of
+them on a single page, first fetching every row and concatenating the
+HTML as the phonebook used to do, then streaming it with app.py. Checks
+that both produce the same markup, and prints the time to the first table
+row, the total time and the peak memory of each.
+
+Usage: python benchmark_streaming.py [size...]
+"""
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+import sqlalchemy
+
+database_dir = tempfile.mkdtemp()
+os.environ["DB_URL"] = "sqlite:///" + os.path.join(database_dir, "phonebook.db")
+# A single page with all the entries
+os.environ["PAGE_SIZE"] = str(10 ** 9)
+# Render the page every time
+os.environ["PAGE_CACHE"] = "off"
+
+import app  # pylint: disable=wrong-import-position
+
+TABLE_SIZES = [1000, 10000, 100000]
+
+
+def html_list_concatenated(results):
+  """Builds the page in a single string, as html_list used to."""
+  list_html = ""
+  if results:
+    list_html += "<TABLE>\n"
+    list_html += "<TR><TH>Name</TH><TH>Phone Number</TH><TH>Actions</TH></TR>"
+    for row in results:
+      list_html += app.html_row(row)
+    list_html += "</TABLE>\n"
+  return app.LIST_HTML_TEMPLATE.replace("###PHONEBOOK-LIST###", list_html)
+
+
+def print_phonebook_buffered():
+  with app.pool.connect() as db_conn:
+    results = db_conn.execute(app.get_schema().first_page).fetchall()
+  return html_list_concatenated(results)
+
+
+def measure(render):
+  """Returns the first row time, total time and peak memory of a render.
+  Args:
+    render: Function returning the page as an iterable of strings.
+  """
+  tracemalloc.start()
+  start = time.perf_counter()
+  first_row = None
+  for chunk in render():
+    if first_row is None and chunk.startswith("<TR>"):
+      first_row = time.perf_counter() - start
+  total = time.perf_counter() - start
+  _, peak = tracemalloc.get_traced_memory()
+  tracemalloc.stop()
+  return first_row or total, total, peak
+
+
+def fill_table(size):
+  phonebook = app.get_schema()
+  with app.pool.connect() as db_conn:
+    db_conn.execute(sqlalchemy.delete(phonebook.table))
+    db_conn.execute(phonebook.insert, [
+        {"name": "Contact %07d" % index, "phone_number": "555-%07d" % index}
+        for index in range(size)])
+    db_conn.commit()
+
+
+def streamed_page():
+  chunks = app.print_phonebook()
+  try:
+    for chunk in chunks:
+      yield chunk
+  finally:
+    chunks.close()
+
+
+def main():
+  sizes = [int(size) for size in sys.argv[1:]] or TABLE_SIZES
+  print("{:>8} {:>10} {:>12} {:>12} {:>12}".format(
+      "rows", "mode", "first row", "total", "peak memory"))
+  for size in sizes:
+    fill_table(size)
+    assert "".join(streamed_page()) == print_phonebook_buffered()
+    for mode, render in (("buffered", lambda: [print_phonebook_buffered()]),
+                         ("streamed", streamed_page)):
+      first_row, total, peak = measure(render)
+      print("{:>8} {:>10} {:>10.1f}ms {:>10.1f}ms {:>10.1f}MB".format(
+          size, mode, first_row * 1000, total * 1000, peak / 1e6))
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,108 @@
+#!/usr/bin/env python
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Checks the routing of the phonebook reads to a read replica.
+
+Runs app.py with two SQLite databases, a primary and a replica which is
+only updated when replicate() copies the primary into it, standing in for
+replication lag. Checks that writes go to the primary, that reads go to
+the replica, and that a session reads its own writes from the primary
+until READ_YOUR_WRITES_SECONDS have passed.
+
+Usage: python check_read_replica.py
+"""
+import os
+import sqlite3
+import tempfile
+import time
+
+import sqlalchemy
+
+database_dir = tempfile.mkdtemp()
+PRIMARY_FILE = os.path.join(database_dir, "primary.db")
+REPLICA_FILE = os.path.join(database_dir, "replica.db")
+os.environ["DB_URL"] = "sqlite:///" + PRIMARY_FILE
+os.environ["DB_READ_URL"] = "sqlite:///" + REPLICA_FILE
+os.environ["READ_YOUR_WRITES_SECONDS"] = "1"
+
+import app  # pylint: disable=wrong-import-position
+
+
+def replicate():
+  """Copies the primary into the replica."""
+  # Connections of the replica pool would keep the old file open
+  app.read_pool.dispose()
+  with sqlite3.connect(PRIMARY_FILE) as primary, \
+      sqlite3.connect(REPLICA_FILE) as replica:
+    primary.backup(replica)
+
+
+class StatementCounter(object):
+  """Counts the statements sent to an engine."""
+
+  def __init__(self, engine):
+    self.count = 0
+    sqlalchemy.event.listen(engine, "before_cursor_execute", self._count)
+
+  def _count(self, *args):
+    self.count += 1
+
+
+def get_page(client, path="/"):
+  response = client.get(path)
+  try:
+    return response.get_data(as_text=True)
+  finally:
+    response.close()
+
+
+def main():
+  app.load_schema()
+  replicate()
+  primary = StatementCounter(app.pool)
+  replica = StatementCounter(app.read_pool)
+  writer = app.app.test_client()
+  reader = app.app.test_client()
+
+  response = writer.post("/add", data={"name": "Ada", "number": "555-0100"})
+  assert response.status_code == 200
+  assert app.WRITE_COOKIE in response.headers["Set-Cookie"]
+  assert replica.count == 0, "Writes must go to the primary"
+
+  # The writer reads its write from the primary, other sessions read the
+  # replica, which doesn't have it yet
+  assert "Ada" in get_page(writer)
+  assert "Ada" in get_page(writer, "/search?q=Ada")
+  assert "Ada" in get_page(writer, "/export")
+  assert replica.count == 0, "The writer must read from the primary"
+  primary_reads = primary.count
+  assert "Ada" not in get_page(reader)
+  assert "Ada" not in get_page(reader, "/search?q=Ada")
+  assert "Ada" not in get_page(reader, "/export")
+  assert primary.count == primary_reads, "Reads must go to the replica"
+
+  # Once replicated, everyone sees it, and the writer is back on the
+  # replica after its read-your-writes window
+  replicate()
+  assert "Ada" in get_page(reader)
+  time.sleep(app.READ_YOUR_WRITES_SECONDS)
+  primary_reads = primary.count
+  assert "Ada" in get_page(writer, "/search?q=Ada")
+  assert primary.count == primary_reads, "The window must expire"
+  print("Reads from the replica, writes and read-your-writes from the "
+        "primary: OK")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,205 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Connection pool and query metrics of a SQLAlchemy engine.
+
+Metrics are collected with the pool and cursor events of the engine, and
+rendered in the Prometheus text format, without depending on a client
+library. The time to check out a connection, including the wait for a free
+one, is measured by TimedQueuePool, which the engine must use as its pool
+class.
+"""
+import bisect
+import threading
+import time
+
+import sqlalchemy
+from sqlalchemy.pool import QueuePool
+
+# Upper bounds of the histogram buckets, in seconds
+BUCKET_BOUNDS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25,
+                 0.5, 1, 2.5, 5, 10)
+
+STATEMENT_TYPES = ("select", "insert", "update", "delete")
+
+
+class Histogram(object):
+  """Histogram with fixed buckets. Not thread-safe."""
+
+  def __init__(self):
+    self.counts = [0] * (len(BUCKET_BOUNDS) + 1)
+    self.count = 0
+    self.total = 0.0
+
+  def observe(self, seconds):
+    self.counts[bisect.bisect_left(BUCKET_BOUNDS, seconds)] += 1
+    self.count += 1
+    self.total += seconds
+
+  def samples(self, name, labels=""):
+    """Yields the lines of the histogram in the Prometheus text format."""
+    separator = "," if labels else ""
+    cumulative = 0
+    for bound, count in zip(BUCKET_BOUNDS + ("+Inf",), self.counts):
+      cumulative += count
+      yield '{}_bucket{{{}{}le="{}"}} {}'.format(
+          name, labels, separator, bound, cumulative)
+    labels = "{" + labels + "}" if labels else ""
+    yield "{}_sum{} {}".format(name, labels, self.total)
+    yield "{}_count{} {}".format(name, labels, self.count)
+
+
+class TimedQueuePool(QueuePool):
+  """QueuePool measuring how long each checkout takes.
+
+  SQLAlchemy has no event before a checkout, so the time spent waiting for
+  a free connection can only be measured around connect().
+  """
+
+  # Set by DatabaseMetrics, called with the checkout time and whether it
+  # timed out
+  checkout_observer = None
+
+  def connect(self):
+    start = time.perf_counter()
+    timed_out = False
+    try:
+      return super().connect()
+    except sqlalchemy.exc.TimeoutError:
+      timed_out = True
+      raise
+    finally:
+      if self.checkout_observer is not None:
+        self.checkout_observer(time.perf_counter() - start, timed_out)
+
+
+class DatabaseMetrics(object):
+  """Collects the pool and statement metrics of an engine."""
+
+  def __init__(self, engine, prefix="db"):
+    """Starts collecting metrics.
+
+    Args:
+      engine: SQLAlchemy engine, ideally with a TimedQueuePool.
+      prefix: Prefix of the names of the metrics.
+    """
+    self.engine = engine
+    self.prefix = prefix
+    self._lock = threading.Lock()
+    self._checkout = Histogram()
+    self._checkout_timeouts = 0
+    self._connections_created = 0
+    self._connections_invalidated = 0
+    self._statements = {}
+    self._statement_errors = {}
+    if isinstance(engine.pool, TimedQueuePool):
+      engine.pool.checkout_observer = self._observe_checkout
+    sqlalchemy.event.listen(engine, "connect", self._on_connect)
+    sqlalchemy.event.listen(engine, "invalidate", self._on_invalidate)
+    sqlalchemy.event.listen(
+        engine, "before_cursor_execute", self._before_execute)
+    sqlalchemy.event.listen(
+        engine, "after_cursor_execute", self._after_execute)
+    sqlalchemy.event.listen(engine, "handle_error", self._on_error)
+
+  def _observe_checkout(self, seconds, timed_out):
+    with self._lock:
+      self._checkout.observe(seconds)
+      self._checkout_timeouts += timed_out
+
+  def _on_connect(self, dbapi_connection, connection_record):
+    with self._lock:
+      self._connections_created += 1
+
+  def _on_invalidate(self, dbapi_connection, connection_record, exception):
+    with self._lock:
+      self._connections_invalidated += 1
+
+  def _before_execute(self, conn, cursor, statement, parameters, context,
+                      executemany):
+    conn.info.setdefault("statement_start", []).append(time.perf_counter())
+
+  def _after_execute(self, conn, cursor, statement, parameters, context,
+                     executemany):
+    seconds = time.perf_counter() - conn.info["statement_start"].pop()
+    statement_type = self._statement_type(statement)
+    with self._lock:
+      histogram = self._statements.get(statement_type)
+      if histogram is None:
+        histogram = self._statements[statement_type] = Histogram()
+      histogram.observe(seconds)
+
+  def _on_error(self, context):
+    if context.connection is not None:
+      starts = context.connection.info.get("statement_start")
+      if starts:
+        starts.pop()
+    statement_type = self._statement_type(context.statement or "")
+    with self._lock:
+      self._statement_errors[statement_type] = (
+          self._statement_errors.get(statement_type, 0) + 1)
+
+  @staticmethod
+  def _statement_type(statement):
+    words = statement.lstrip().split(None, 1)
+    statement_type = words[0].lower() if words else ""
+    return statement_type if statement_type in STATEMENT_TYPES else "other"
+
+  def render(self):
+    """Returns all the metrics in the Prometheus text format."""
+    prefix = self.prefix
+    lines = []
+
+    def metric(name, metric_type, help_text):
+      lines.append("# HELP {}_{} {}".format(prefix, name, help_text))
+      lines.append("# TYPE {}_{} {}".format(prefix, name, metric_type))
+      return prefix + "_" + name
+
+    pool = self.engine.pool
+    if isinstance(pool, QueuePool):
+      for name, value, help_text in (
+          ("pool_size", pool.size(), "Configured size of the pool."),
+          ("pool_checked_out", pool.checkedout(),
+           "Connections currently in use."),
+          ("pool_checked_in", pool.checkedin(),
+           "Idle connections in the pool."),
+          # Negative while the pool hasn't opened pool_size connections
+          ("pool_overflow", pool.overflow(),
+           "Connections open beyond the pool size."),
+      ):
+        lines.append("{} {}".format(metric(name, "gauge", help_text), value))
+
+    with self._lock:
+      name = metric("pool_checkout_seconds", "histogram",
+                    "Time to check out a connection, waits included.")
+      lines.extend(self._checkout.samples(name))
+      name = metric("pool_checkout_timeouts_total", "counter",
+                    "Checkouts that timed out waiting for a connection.")
+      lines.append("{} {}".format(name, self._checkout_timeouts))
+      name = metric("connections_created_total", "counter",
+                    "Database connections opened.")
+      lines.append("{} {}".format(name, self._connections_created))
+      name = metric("connections_invalidated_total", "counter",
+                    "Database connections invalidated after an error.")
+      lines.append("{} {}".format(name, self._connections_invalidated))
+      name = metric("statement_seconds", "histogram",
+                    "Time to execute a statement, by statement type.")
+      for statement_type, histogram in sorted(self._statements.items()):
+        lines.extend(histogram.samples(
+            name, 'statement="{}"'.format(statement_type)))
+      name = metric("statement_errors_total", "counter",
+                    "Statements that failed, by statement type.")
+      for statement_type, count in sorted(self._statement_errors.items()):
+        lines.append('{}{{statement="{}"}} {}'.format(
+            name, statement_type, count))
+    return "\n".join(lines) + "\n"
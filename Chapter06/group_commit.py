@@ -0,0 +1,122 @@
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Commits concurrent writes together in a single transaction.
+
+When each write has its own transaction, the commit round trip limits how
+many writes per second the database takes. A GroupCommitter queues the
+writes to a single writer thread, which waits a short window for other
+writes to arrive and commits them all at once. Each caller still waits
+until its own write is committed, and gets its result or its exception.
+"""
+import concurrent.futures
+import queue
+import threading
+import time
+
+
+class GroupCommitter(object):
+  """Single writer batching the writes submitted by concurrent threads."""
+
+  def __init__(self, engine, commit, window=0.002, max_writes=100):
+    """Prepares the writer, which starts with the first write.
+
+    Args:
+      engine: SQLAlchemy engine of the database.
+      commit: Function committing the writes, called with the connection.
+      window: Seconds the writer waits for more writes after the first one.
+      max_writes: Maximum number of writes in each transaction.
+    """
+    self.engine = engine
+    self.commit = commit
+    self.window = window
+    self.max_writes = max_writes
+    self._queue = queue.Queue()
+    self._thread = None
+    self._lock = threading.Lock()
+
+  def submit(self, operation):
+    """Runs a write in the next transaction, and waits until it's committed.
+
+    Args:
+      operation: Function running the write, called with the connection.
+    Returns:
+      The return value of operation.
+    Raises:
+      The exception raised by operation or by the commit.
+    """
+    if self._thread is None:
+      with self._lock:
+        if self._thread is None:
+          self._thread = threading.Thread(
+              target=self._write_forever, name="group-commit", daemon=True)
+          self._thread.start()
+    future = concurrent.futures.Future()
+    self._queue.put((operation, future))
+    return future.result()
+
+  def _next_batch(self):
+    batch = [self._queue.get()]
+    deadline = time.monotonic() + self.window
+    while len(batch) < self.max_writes:
+      remaining = deadline - time.monotonic()
+      try:
+        if remaining > 0:
+          batch.append(self._queue.get(timeout=remaining))
+        else:
+          # Past the window, only take the writes already waiting
+          batch.append(self._queue.get_nowait())
+      except queue.Empty:
+        break
+    return batch
+
+  def _write_forever(self):
+    while True:
+      batch = self._next_batch()
+      try:
+        self._write(batch)
+      except Exception as error:  # pylint: disable=broad-except
+        # Not knowing whether the commit went through, don't retry
+        for _, future in batch:
+          if not future.done():
+            future.set_exception(error)
+
+  def _write(self, batch):
+    results = []
+    with self.engine.connect() as db_conn:
+      try:
+        for operation, _ in batch:
+          results.append(operation(db_conn))
+      except Exception:  # pylint: disable=broad-except
+        db_conn.rollback()
+        results = None
+      else:
+        self.commit(db_conn)
+    if results is None:
+      # A write failed and rolled back the others, so run each one in its
+      # own transaction, to only fail the callers of the failed ones
+      for operation, future in batch:
+        self._write_alone(operation, future)
+      return
+    for (_, future), result in zip(batch, results):
+      future.set_result(result)
+
+  def _write_alone(self, operation, future):
+    try:
+      with self.engine.connect() as db_conn:
+        result = operation(db_conn)
+        self.commit(db_conn)
+    except Exception as error:  # pylint: disable=broad-except
+      future.set_exception(error)
+    else:
+      future.set_result(result)
@@ -0,0 +1,110 @@
+#!/usr/bin/env python
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Compares the QPS of the sync and aio catalog servers with injected latency
+
+Starts catalog.py in each GRPC_SERVER_MODE with EXTRA_LATENCY set, as
+catalog-v2 runs, and sends Catalog calls from concurrent clients for a
+fixed time. With a thread per call, the sync server can't serve more than
+GRPC_MAX_WORKERS calls per EXTRA_LATENCY seconds. Run it from this
+directory after generating catalog_pb2.py.
+
+Usage: python benchmark_aio.py [--latency 1] [--clients 100] [--duration 10]
+"""
+import argparse
+import asyncio
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+
+import grpc
+
+from catalog_pb2 import CatalogRequest
+from catalog_pb2_grpc import CatalogStub
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_server(mode, latency, port):
+    env = dict(os.environ, GRPC_SERVER_MODE=mode, EXTRA_LATENCY=str(latency))
+    return subprocess.Popen(
+        [sys.executable, "-c", "import catalog; catalog.serve({})".format(port)],
+        env=env, cwd=os.path.dirname(os.path.abspath(__file__)),
+    )
+
+
+async def run_clients(port, clients, duration):
+    """Sends calls until the end of the duration, returns their latencies."""
+    async with grpc.aio.insecure_channel("127.0.0.1:{}".format(port)) as channel:
+        await asyncio.wait_for(channel.channel_ready(), timeout=30)
+        stub = CatalogStub(channel)
+        request = CatalogRequest(max_results=4, product_id="dummy")
+        latencies = []
+        errors = []
+        deadline = time.perf_counter() + duration
+
+        async def client():
+            while time.perf_counter() < deadline:
+                start = time.perf_counter()
+                try:
+                    await stub.Catalog(request)
+                except grpc.aio.AioRpcError as error:
+                    errors.append(error.code())
+                else:
+                    latencies.append(time.perf_counter() - start)
+
+        await asyncio.gather(*(client() for _ in range(clients)))
+        return latencies, errors
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.strip().splitlines()[0])
+    parser.add_argument("--latency", type=int, default=1,
+                        help="EXTRA_LATENCY of the server, in seconds")
+    parser.add_argument("--clients", type=int, default=100)
+    parser.add_argument("--duration", type=float, default=10)
+    args = parser.parse_args()
+
+    print("{:>6} {:>8} {:>8} {:>10} {:>10}".format(
+        "mode", "calls", "errors", "QPS", "p50 s"))
+    results = {}
+    for mode in ("sync", "aio"):
+        port = free_port()
+        server = start_server(mode, args.latency, port)
+        try:
+            start = time.perf_counter()
+            latencies, errors = asyncio.run(
+                run_clients(port, args.clients, args.duration))
+            elapsed = time.perf_counter() - start
+        finally:
+            server.terminate()
+            server.wait()
+        results[mode] = len(latencies) / elapsed
+        print("{:>6} {:>8} {:>8} {:>10.1f} {:>10.2f}".format(
+            mode, len(latencies), len(errors), results[mode],
+            statistics.median(latencies) if latencies else 0))
+    print("aio serves {:.1f}x the QPS of sync".format(
+        results["aio"] / results["sync"]))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,98 @@
+#!/usr/bin/env python
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""
+Measures the latency of the Catalog calls as the catalog grows
+
+Calls CatalogService.Catalog directly, without gRPC, for product pages and
+for random samples, on catalogs of increasing sizes. Product pages are
+also timed with a scan of the catalog, as the service used to do. Run it
+from this directory after generating catalog_pb2.py.
+
+Usage: python benchmark_catalog.py [size...]
+"""
+import random
+import sys
+import timeit
+
+from catalog import CatalogService, ProductCatalog
+from catalog_pb2 import CatalogItem, CatalogRequest
+
+CATALOG_SIZES = [10, 1000, 100000, 1000000]
+CALLS = 2000
+SAMPLE_SIZE = 8
+
+
+def make_items(count):
+    return [
+        CatalogItem(id="electric-sheep{:07d}".format(index),
+                    title="Sheep {}".format(index), author="Jane Smith",
+                    rating=index % 5 + 1, price_dollars="5",
+                    price_cents="00")
+        for index in range(count)
+    ]
+
+
+def scan_catalog(items, product_id):
+    """Finds a product the way the service used to."""
+    found = []
+    for item in items:
+        if item.id == product_id:
+            found.append(item)
+    return found
+
+
+def time_calls(call, requests, number):
+    requests = iter(requests)
+    return timeit.timeit(lambda: call(next(requests)), number=number) / number
+
+
+def main():
+    sizes = sorted(int(size) for size in sys.argv[1:]) or CATALOG_SIZES
+    print("{:>9} {:>14} {:>14} {:>14}".format(
+        "items", "product (us)", "sample (us)", "scan (us)"))
+    for size in sizes:
+        items = make_items(size)
+        service = CatalogService(ProductCatalog(items))
+        ids = [random.choice(items).id for _ in range(CALLS)]
+
+        product = time_calls(
+            lambda product_id: service.Catalog(
+                CatalogRequest(max_results=1, product_id=product_id), None),
+            ids, CALLS)
+        sample = time_calls(
+            lambda _: service.Catalog(
+                CatalogRequest(max_results=SAMPLE_SIZE, product_id="dummy"),
+                None),
+            ids, CALLS)
+        # The scan is slow on large catalogs, time fewer calls
+        scan_calls = max(10, min(CALLS, 10 ** 7 // size))
+        scan = time_calls(
+            lambda product_id: scan_catalog(items, product_id),
+            ids, scan_calls)
+
+        response = service.Catalog(
+            CatalogRequest(max_results=1, product_id=ids[0]), None)
+        assert [item.id for item in response.items] == [ids[0]]
+        response = service.Catalog(
+            CatalogRequest(max_results=SAMPLE_SIZE, product_id="dummy"),
+            None)
+        assert len({item.id for item in response.items}) == min(
+            SAMPLE_SIZE, size)
+        print("{:>9} {:>14.1f} {:>14.1f} {:>14.1f}".format(
+            size, product * 1e6, sample * 1e6, scan * 1e6))
+
+
+if __name__ == "__main__":
+    main()
@@ -15,6 +15,8 @@
 Provides the specified number of items from the product catalog
 """
 from concurrent import futures
+import asyncio
+import bisect
 import grpc
 import os
 import random
@@ -22,10 +24,29 @@ import time
 
 from catalog_pb2 import (
     CatalogItem,
+    CatalogPage,
     CatalogResponse,
 )
 import catalog_pb2_grpc
 
+# "sync" serves each call with a thread of a pool of GRPC_MAX_WORKERS, so
+# that slow calls can use up the pool, "aio" serves all of them with
+# asyncio. Calls beyond GRPC_MAX_CONCURRENT_RPCS are rejected with
+# RESOURCE_EXHAUSTED, 0 accepts all of them
+GRPC_SERVER_MODE = os.getenv("GRPC_SERVER_MODE", "sync")
+GRPC_MAX_WORKERS = int(os.getenv("GRPC_MAX_WORKERS", "10"))
+GRPC_MAX_CONCURRENT_RPCS = int(os.getenv("GRPC_MAX_CONCURRENT_RPCS", "0"))
+
+# Items sent in each page of ListCatalog by default, and at most
+DEFAULT_PAGE_SIZE = 100
+MAX_PAGE_SIZE = 1000
+
+# Maximum number of ids of a GetItems request
+MAX_GET_ITEMS = 1000
+
+GET_ITEMS_ERROR = "At most {} ids can be requested".format(MAX_GET_ITEMS)
+PAGE_SIZE_ERROR = "page_size can't be negative"
+
 product_catalog = [
     CatalogItem(id="electric-sheep01", title="Sheeps'R Us", author="Stephan Doe", description="Stephan's psychodelic color palette takes NFTs to the next level.", rating=3, price_dollars="5", price_cents="00"),
     CatalogItem(id="electric-sheep02", title="Colourful Nightmare", author="Jane Smith", description="Simple but impactful, this masterpiece is worth every single cent.", rating=5, price_dollars="7", price_cents="75"),
@@ -41,35 +62,155 @@ product_catalog = [
     CatalogItem(id="electric-sheep12", title="Electroflock", author="Julian Fake", description="The floating sheep can help you in your mindfulness sessions", rating=1,price_dollars="9", price_cents="50"),
 ]
 
+
+class ProductCatalog(object):
+    """Catalog items indexed by id, to find one without a scan."""
+
+    def __init__(self, items):
+        # A sequence, for random.sample to pick positions in it
+        self.items = tuple(items)
+        self.by_id = {}
+        for item in self.items:
+            # Ids are unique, keep the first item like a scan would
+            self.by_id.setdefault(item.id, item)
+        # Ids in order, to resume listing the catalog after any of them
+        self.sorted_ids = sorted(self.by_id)
+
+    def __len__(self):
+        return len(self.items)
+
+    def get(self, product_id):
+        """Returns the item with an id, or None if there is none."""
+        return self.by_id.get(product_id)
+
+    def sample(self, count):
+        """Returns up to count random items, in O(count) time.
+
+        random.sample only copies the sequence when it has few more items
+        than requested, otherwise it draws count distinct positions.
+        """
+        return random.sample(self.items, min(count, len(self.items)))
+
+    def page(self, after, count):
+        """Returns up to count items in id order, with ids after a cursor.
+
+        Args:
+            after: Id after which the page starts, empty for the first one.
+            count: Maximum number of items of the page.
+        Returns:
+            The items, and the id to continue from, empty after the last page.
+        """
+        start = bisect.bisect_right(self.sorted_ids, after) if after else 0
+        ids = self.sorted_ids[start:start + count]
+        more = start + count < len(self.sorted_ids)
+        items = [self.by_id[product_id] for product_id in ids]
+        return items, ids[-1] if more else ""
+
+
 class CatalogService(
     catalog_pb2_grpc.CatalogServicer
 ):
+    def __init__(self, catalog=None):
+        if catalog is None:
+            catalog = ProductCatalog(product_catalog)
+        self.catalog = catalog
+
     def Catalog(self, request, context):
         latency = int(os.getenv("EXTRA_LATENCY", "0"))
         if latency>0:
             time.sleep(latency)
-        num_results = min(request.max_results, len(product_catalog))
-        random_items = []
+        return self.catalog_response(request)
+
+    def GetItems(self, request, context):
+        if len(request.ids) > MAX_GET_ITEMS:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, GET_ITEMS_ERROR)
+        return self.items_response(request)
+
+    def ListCatalog(self, request, context):
+        if request.page_size < 0:
+            context.abort(grpc.StatusCode.INVALID_ARGUMENT, PAGE_SIZE_ERROR)
+        # Stops when the client cancels the call
+        yield from self.catalog_pages(request)
+
+    def catalog_response(self, request):
         if request.product_id != "dummy":
-            for item in product_catalog:
-                if item.id == request.product_id:
-                    random_items.append(item)
+            item = self.catalog.get(request.product_id)
+            random_items = [item] if item is not None else []
         else:
-            random_items = random.sample(
-                product_catalog, num_results
-            )
+            random_items = self.catalog.sample(request.max_results)
 
         return CatalogResponse(items=random_items)
 
-def serve():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+    def items_response(self, request):
+        items = [
+            self.catalog.get(product_id) for product_id in request.ids
+        ]
+        return CatalogResponse(
+            items=[item for item in items if item is not None]
+        )
+
+    def catalog_pages(self, request):
+        page_size = min(request.page_size or DEFAULT_PAGE_SIZE, MAX_PAGE_SIZE)
+        cursor = request.cursor
+        while True:
+            items, cursor = self.catalog.page(cursor, page_size)
+            yield CatalogPage(items=items, next_cursor=cursor)
+            if not cursor:
+                break
+
+
+class AsyncCatalogService(CatalogService):
+    """CatalogService for grpc.aio, where the latency blocks no thread."""
+
+    async def Catalog(self, request, context):
+        latency = int(os.getenv("EXTRA_LATENCY", "0"))
+        if latency>0:
+            await asyncio.sleep(latency)
+        return self.catalog_response(request)
+
+    async def GetItems(self, request, context):
+        if len(request.ids) > MAX_GET_ITEMS:
+            await context.abort(
+                grpc.StatusCode.INVALID_ARGUMENT, GET_ITEMS_ERROR
+            )
+        return self.items_response(request)
+
+    async def ListCatalog(self, request, context):
+        if request.page_size < 0:
+            await context.abort(
+                grpc.StatusCode.INVALID_ARGUMENT, PAGE_SIZE_ERROR
+            )
+        for page in self.catalog_pages(request):
+            yield page
+
+
+def serve(port=50052):
+    if GRPC_SERVER_MODE == "aio":
+        asyncio.run(serve_aio(port))
+        return
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=GRPC_MAX_WORKERS),
+        maximum_concurrent_rpcs=GRPC_MAX_CONCURRENT_RPCS or None,
+    )
     catalog_pb2_grpc.add_CatalogServicer_to_server(
         CatalogService(), server
     )
-    server.add_insecure_port("[::]:50052")
+    server.add_insecure_port("[::]:{}".format(port))
     server.start()
     server.wait_for_termination()
 
+async def serve_aio(port=50052):
+    # A single thread serves all the calls, while the others are waiting
+    server = grpc.aio.server(
+        maximum_concurrent_rpcs=GRPC_MAX_CONCURRENT_RPCS or None,
+    )
+    catalog_pb2_grpc.add_CatalogServicer_to_server(
+        AsyncCatalogService(), server
+    )
+    server.add_insecure_port("[::]:{}".format(port))
+    await server.start()
+    await server.wait_for_termination()
+
 
 if __name__ == "__main__":
     serve()
\ No newline at end of file
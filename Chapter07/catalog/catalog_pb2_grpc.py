@@ -33,6 +33,16 @@ class CatalogStub(object):
                 request_serializer=catalog__pb2.CatalogRequest.SerializeToString,
                 response_deserializer=catalog__pb2.CatalogResponse.FromString,
                 )
+        self.GetItems = channel.unary_unary(
+                '/Catalog/GetItems',
+                request_serializer=catalog__pb2.GetItemsRequest.SerializeToString,
+                response_deserializer=catalog__pb2.CatalogResponse.FromString,
+                )
+        self.ListCatalog = channel.unary_stream(
+                '/Catalog/ListCatalog',
+                request_serializer=catalog__pb2.ListCatalogRequest.SerializeToString,
+                response_deserializer=catalog__pb2.CatalogPage.FromString,
+                )
 
 
 class CatalogServicer(object):
@@ -44,6 +54,20 @@ class CatalogServicer(object):
         context.set_details('Method not implemented!')
         raise NotImplementedError('Method not implemented!')
 
+    def GetItems(self, request, context):
+        """Items with the ids found in the catalog, in the order of the request
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def ListCatalog(self, request, context):
+        """Whole catalog in id order, one page at a time
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
 
 def add_CatalogServicer_to_server(servicer, server):
     rpc_method_handlers = {
@@ -52,6 +76,16 @@ def add_CatalogServicer_to_server(servicer, server):
                     request_deserializer=catalog__pb2.CatalogRequest.FromString,
                     response_serializer=catalog__pb2.CatalogResponse.SerializeToString,
             ),
+            'GetItems': grpc.unary_unary_rpc_method_handler(
+                    servicer.GetItems,
+                    request_deserializer=catalog__pb2.GetItemsRequest.FromString,
+                    response_serializer=catalog__pb2.CatalogResponse.SerializeToString,
+            ),
+            'ListCatalog': grpc.unary_stream_rpc_method_handler(
+                    servicer.ListCatalog,
+                    request_deserializer=catalog__pb2.ListCatalogRequest.FromString,
+                    response_serializer=catalog__pb2.CatalogPage.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'Catalog', rpc_method_handlers)
@@ -78,3 +112,37 @@ class Catalog(object):
             catalog__pb2.CatalogResponse.FromString,
             options, channel_credentials,
             insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def GetItems(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_unary(request, target, '/Catalog/GetItems',
+            catalog__pb2.GetItemsRequest.SerializeToString,
+            catalog__pb2.CatalogResponse.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
+
+    @staticmethod
+    def ListCatalog(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(request, target, '/Catalog/ListCatalog',
+            catalog__pb2.ListCatalogRequest.SerializeToString,
+            catalog__pb2.CatalogPage.FromString,
+            options, channel_credentials,
+            insecure, call_credentials, compression, wait_for_ready, timeout, metadata)
@@ -27,7 +27,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\rcatalog.proto\"9\n\x0e\x43\x61talogRequest\x12\x13\n\x0bmax_results\x18\x01 \x01(\x05\x12\x12\n\nproduct_id\x18\x02 \x01(\t\"\x89\x01\n\x0b\x43\x61talogItem\x12\n\n\x02id\x18\x01 \x01(\t\x12\r\n\x05title\x18\x02 \x01(\t\x12\x0e\n\x06\x61uthor\x18\x03 \x01(\t\x12\x13\n\x0b\x64\x65scription\x18\x04 \x01(\t\x12\x0e\n\x06rating\x18\x05 \x01(\x05\x12\x15\n\rprice_dollars\x18\x06 \x01(\t\x12\x13\n\x0bprice_cents\x18\x07 \x01(\t\".\n\x0f\x43\x61talogResponse\x12\x1b\n\x05items\x18\x01 \x03(\x0b\x32\x0c.CatalogItem27\n\x07\x43\x61talog\x12,\n\x07\x43\x61talog\x12\x0f.CatalogRequest\x1a\x10.CatalogResponseb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\rcatalog.proto\"9\n\x0e\x43\x61talogRequest\x12\x13\n\x0bmax_results\x18\x01 \x01(\x05\x12\x12\n\nproduct_id\x18\x02 \x01(\t\"\x89\x01\n\x0b\x43\x61talogItem\x12\n\n\x02id\x18\x01 \x01(\t\x12\r\n\x05title\x18\x02 \x01(\t\x12\x0e\n\x06\x61uthor\x18\x03 \x01(\t\x12\x13\n\x0b\x64\x65scription\x18\x04 \x01(\t\x12\x0e\n\x06rating\x18\x05 \x01(\x05\x12\x15\n\rprice_dollars\x18\x06 \x01(\t\x12\x13\n\x0bprice_cents\x18\x07 \x01(\t\".\n\x0f\x43\x61talogResponse\x12\x1b\n\x05items\x18\x01 \x03(\x0b\x32\x0c.CatalogItem\"\x1e\n\x0fGetItemsRequest\x12\x0b\n\x03ids\x18\x01 \x03(\t\"7\n\x12ListCatalogRequest\x12\x11\n\tpage_size\x18\x01 \x01(\x05\x12\x0e\n\x06\x63ursor\x18\x02 \x01(\t\"?\n\x0b\x43\x61talogPage\x12\x1b\n\x05items\x18\x01 \x03(\x0b\x32\x0c.CatalogItem\x12\x13\n\x0bnext_cursor\x18\x02 \x01(\t2\x9b\x01\n\x07\x43\x61talog\x12,\n\x07\x43\x61talog\x12\x0f.CatalogRequest\x1a\x10.CatalogResponse\x12.\n\x08GetItems\x12\x10.GetItemsRequest\x1a\x10.CatalogResponse\x12\x32\n\x0bListCatalog\x12\x13.ListCatalogRequest\x1a\x0c.CatalogPage0\x01\x62\x06proto3')
 
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, globals())
 _builder.BuildTopDescriptorsAndMessages(DESCRIPTOR, 'catalog_pb2', globals())
@@ -40,6 +40,12 @@ if _descriptor._USE_C_DESCRIPTORS == False:
   _CATALOGITEM._serialized_end=214
   _CATALOGRESPONSE._serialized_start=216
   _CATALOGRESPONSE._serialized_end=262
-  _CATALOG._serialized_start=264
-  _CATALOG._serialized_end=319
+  _GETITEMSREQUEST._serialized_start=264
+  _GETITEMSREQUEST._serialized_end=294
+  _LISTCATALOGREQUEST._serialized_start=296
+  _LISTCATALOGREQUEST._serialized_end=351
+  _CATALOGPAGE._serialized_start=353
+  _CATALOGPAGE._serialized_end=416
+  _CATALOG._serialized_start=419
+  _CATALOG._serialized_end=574
 # @@protoc_insertion_point(module_scope)
@@ -17,7 +17,7 @@ import os
 from flask import Flask, render_template
 import grpc
 
-from catalog_pb2 import CatalogRequest
+from catalog_pb2 import CatalogRequest, GetItemsRequest, ListCatalogRequest
 from catalog_pb2_grpc import CatalogStub
 
 from offers_pb2 import OfferRequest
@@ -37,6 +37,52 @@ offers_channel = grpc.insecure_channel(
 )
 offers_client = OffersStub(offers_channel)
 
+# Times a catalog listing resumes after losing the connection
+LIST_CATALOG_RETRIES = 3
+
+def get_catalog_items(product_ids):
+    """Gets several items of the catalog with a single call.
+
+    Args:
+        product_ids: Ids of the items.
+    Returns:
+        Dict from id to item, without the ids that aren't in the catalog.
+    """
+    catalog_response = catalog_client.GetItems(
+        GetItemsRequest(ids=product_ids)
+    )
+    return {item.id: item for item in catalog_response.items}
+
+def list_catalog(page_size=100, cursor=""):
+    """Iterates over the whole catalog, in id order.
+
+    The catalog is streamed in pages, and the listing resumes from the last
+    page received if the connection is lost.
+
+    Args:
+        page_size: Number of items of each page.
+        cursor: next_cursor of a page, to start after it.
+    Yields:
+        The items of the catalog.
+    """
+    retries = 0
+    while True:
+        try:
+            for page in catalog_client.ListCatalog(
+                ListCatalogRequest(page_size=page_size, cursor=cursor)
+            ):
+                yield from page.items
+                if not page.next_cursor:
+                    return
+                cursor = page.next_cursor
+                retries = 0
+            return
+        except grpc.RpcError as error:
+            if (error.code() != grpc.StatusCode.UNAVAILABLE
+                    or retries == LIST_CATALOG_RETRIES):
+                raise
+            retries += 1
+
 @app.route("/")
 def render_homepage():
     catalog_request = CatalogRequest(
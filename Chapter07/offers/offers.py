@@ -16,6 +16,8 @@
 Provides up to 3 offers randomly sorted
 """
 from concurrent import futures
+import asyncio
+import os
 import random
 
 import grpc
@@ -26,6 +28,13 @@ from offers_pb2 import (
 )
 import offers_pb2_grpc
 
+# "sync" serves each call with a thread of a pool of GRPC_MAX_WORKERS, "aio"
+# serves all of them with asyncio. Calls beyond GRPC_MAX_CONCURRENT_RPCS are
+# rejected with RESOURCE_EXHAUSTED, 0 accepts all of them
+GRPC_SERVER_MODE = os.getenv("GRPC_SERVER_MODE", "sync")
+GRPC_MAX_WORKERS = int(os.getenv("GRPC_MAX_WORKERS", "10"))
+GRPC_MAX_CONCURRENT_RPCS = int(os.getenv("GRPC_MAX_CONCURRENT_RPCS", "0"))
+
 active_offers = [
     NftOffer(id=1, description="Buy 3 Nfts and get the 4th for free!"),
     NftOffer(id=2, description="Save 20% on your first purchase with coupon code NFTNEWBIE!"),
@@ -45,15 +54,36 @@ class OfferService(
 
         return OfferResponse(offers=random_offers)
 
-def serve():
-    server = grpc.server(futures.ThreadPoolExecutor(max_workers=10))
+class AsyncOfferService(OfferService):
+    async def Offer(self, request, context):
+        return super().Offer(request, context)
+
+def serve(port=50051):
+    if GRPC_SERVER_MODE == "aio":
+        asyncio.run(serve_aio(port))
+        return
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=GRPC_MAX_WORKERS),
+        maximum_concurrent_rpcs=GRPC_MAX_CONCURRENT_RPCS or None,
+    )
     offers_pb2_grpc.add_OffersServicer_to_server(
         OfferService(), server
     )
-    server.add_insecure_port("[::]:50051")
+    server.add_insecure_port("[::]:{}".format(port))
     server.start()
     server.wait_for_termination()
 
+async def serve_aio(port=50051):
+    server = grpc.aio.server(
+        maximum_concurrent_rpcs=GRPC_MAX_CONCURRENT_RPCS or None,
+    )
+    offers_pb2_grpc.add_OffersServicer_to_server(
+        AsyncOfferService(), server
+    )
+    server.add_insecure_port("[::]:{}".format(port))
+    await server.start()
+    await server.wait_for_termination()
+
 
 if __name__ == "__main__":
     serve()
\ No newline at end of file
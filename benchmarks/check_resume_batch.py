@@ -0,0 +1,101 @@
+#!/usr/bin/env python
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Checks the errors of the /batch route of the Chapter04 App Engine service.
+
+Sends CSV and NDJSON lists of recipients which can't be decoded or parsed
+to the Flask app, reading its templates from a local fake GCS. An error in
+the first recipient must be answered with a 400. An error further in the
+body must end the NDJSON response with an error line, and the zip archive
+with an ERROR.txt file.
+
+Usage: python check_resume_batch.py
+"""
+import io
+import json
+import os
+import sys
+import zipfile
+
+from fake_gcs import FakeGCS
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICE_DIR = os.path.join(REPO_DIR, "Chapter04", "app_engine")
+BUCKET_NAME = "resume_xew878w6e"
+# Enough recipients to come after the first chunk decoded from the body
+VALID_RECIPIENTS = 2000
+INVALID_UTF8 = b"\xff\xfe"
+
+
+def bodies():
+  """Returns the invalid bodies, with the error in the first recipient and
+  with the error after VALID_RECIPIENTS recipients, by media type."""
+  csv_rows = [b"Person %d,Company %d\n" % (index, index)
+              for index in range(VALID_RECIPIENTS)]
+  ndjson_rows = [b'["Person %d", "Company %d"]\n' % (index, index)
+                 for index in range(VALID_RECIPIENTS)]
+  too_long = b"x" * 200000 + b",Company\n"
+  return {
+      "text/csv": [
+          (INVALID_UTF8 + b",Company\n", b"".join(csv_rows + [INVALID_UTF8])),
+          (too_long, b"".join(csv_rows + [too_long])),
+      ],
+      "application/x-ndjson": [
+          (b'["' + INVALID_UTF8 + b'"]\n',
+           b"".join(ndjson_rows + [b'["' + INVALID_UTF8 + b'"]\n'])),
+      ],
+  }
+
+
+def main():
+  fake = FakeGCS().start()
+  fake.put(BUCKET_NAME, "english.html", b"<h1>##RESUME_HEAD##</h1>")
+  os.environ["STORAGE_EMULATOR_HOST"] = fake.url
+  os.environ["CLOUD_LOGGING"] = "false"
+  os.environ["PREWARM_TEMPLATES"] = "false"
+  os.environ["LOG_REQUEST_TIMINGS"] = "false"
+  sys.path.insert(0, SERVICE_DIR)
+  import main as service  # pylint: disable=import-outside-toplevel
+  client = service.app.test_client()
+
+  for mimetype, cases in bodies().items():
+    for first_error, later_error in cases:
+      response = client.post("/batch", data=first_error,
+                             content_type=mimetype)
+      assert response.status_code == 400, response.status
+
+      response = client.post("/batch", data=later_error,
+                             content_type=mimetype)
+      assert response.status_code == 200, response.status
+      lines = response.get_data().splitlines()
+      # The recipients decoded along with the error are not rendered
+      assert 1 < len(lines) <= VALID_RECIPIENTS + 1, len(lines)
+      assert "error" in json.loads(lines[-1]), lines[-1]
+
+      response = client.post("/batch?format=zip", data=later_error,
+                             content_type=mimetype)
+      assert response.status_code == 200, response.status
+      with zipfile.ZipFile(io.BytesIO(response.get_data())) as archive:
+        names = archive.namelist()
+        assert 1 < len(names) <= VALID_RECIPIENTS + 1, len(names)
+        assert names[-1] == "ERROR.txt", names[-1]
+        print("{}: {}".format(mimetype, archive.read("ERROR.txt").decode(
+            "utf-8").strip()))
+  fake.stop()
+  print("Invalid recipients answered with a 400, or an error at the end of "
+        "the response: OK")
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,139 @@
+#!/usr/bin/env python
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Checks the Cloud Storage calls made by the Chapter04 template caches.
+
+Runs the TemplateCache of the App Engine service and of the Cloud Function
+against a local fake GCS which adds some latency to every call, and counts
+the calls made by concurrent requests for the same template, which must
+be those of a single request. It also checks that the background
+refresher shares its downloads with the requests, and that missing
+templates raise TemplateNotFound. Each copy of the cache runs in its own
+process, as both modules are named template_cache.
+
+Usage: python check_template_cache.py
+"""
+import argparse
+import concurrent.futures
+import os
+import subprocess
+import sys
+import threading
+import time
+
+from fake_gcs import FakeGCS
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVICE_DIRS = [
+    os.path.join(REPO_DIR, "Chapter04", "app_engine"),
+    os.path.join(REPO_DIR, "Chapter04", "cloud_function", "code"),
+]
+BUCKET_NAME = "resume_xew878w6e"
+REQUESTS = 16
+CHECK_INTERVAL = 0.5
+# Seconds added to each call to the fake GCS
+LATENCY = 0.1
+
+
+def concurrent_lookups(cache, template):
+  """Looks the template up from concurrent threads, all at once."""
+  barrier = threading.Barrier(REQUESTS)
+
+  def lookup(_):
+    barrier.wait()
+    return cache.lookup(template)
+
+  with concurrent.futures.ThreadPoolExecutor(REQUESTS) as executor:
+    return list(executor.map(lookup, range(REQUESTS)))
+
+
+def storage_calls(fake, action):
+  """Runs the action, returns the number of calls made to the fake GCS."""
+  before = fake.request_count
+  action()
+  return fake.request_count - before
+
+
+def check_service(service_dir):
+  fake = FakeGCS(latency=LATENCY).start()
+  fake.put(BUCKET_NAME, "english.html", b"<h1>##RESUME_HEAD##</h1>")
+  os.environ["STORAGE_EMULATOR_HOST"] = fake.url
+  sys.path.insert(0, service_dir)
+  from google.cloud import storage  # pylint: disable=import-outside-toplevel
+  import template_cache  # pylint: disable=import-outside-toplevel
+
+  cache = template_cache.TemplateCache(
+      BUCKET_NAME, CHECK_INTERVAL,
+      client=storage.Client.create_anonymous_client())
+
+  # A cold template is checked and downloaded once for all the requests
+  fake.put(BUCKET_NAME, "single.html", b"<h1>##RESUME_HEAD##</h1>")
+  single = storage_calls(fake, lambda: cache.lookup("single.html"))
+  calls = storage_calls(
+      fake, lambda: concurrent_lookups(cache, "english.html"))
+  assert calls == single, "{} calls for a cold template, {} expected".format(
+      calls, single)
+
+  # Once the check interval is over, its generation is checked once
+  time.sleep(CHECK_INTERVAL)
+  single = storage_calls(fake, lambda: cache.lookup("single.html"))
+  calls = storage_calls(
+      fake, lambda: concurrent_lookups(cache, "english.html"))
+  assert calls == single, (
+      "{} calls for an expired template, {} expected".format(calls, single))
+
+  # Before the bucket is listed, a missing template is found missing by
+  # Cloud Storage
+  try:
+    cache.lookup("missing.html")
+  except template_cache.TemplateNotFound:
+    pass
+  else:
+    raise AssertionError("missing.html was found")
+
+  # With the refresher and the requests arriving at startup, each template
+  # is downloaded once
+  fake.put(BUCKET_NAME, "startup.html", b"<h1>##RESUME_HEAD##</h1>")
+  cache = template_cache.TemplateCache(
+      BUCKET_NAME, CHECK_INTERVAL,
+      client=storage.Client.create_anonymous_client())
+  before = fake.download_count
+  cache.start_refresher()
+  # The requests arrive once the bucket is listed, while the refresher
+  # downloads the templates
+  time.sleep(LATENCY * 1.5)
+  concurrent_lookups(cache, "startup.html")
+  cache.wait_until_listed()
+  cache.stop_refresher()
+  downloads = fake.download_count - before
+  assert downloads == len(fake.list(BUCKET_NAME)), (
+      "{} downloads at startup".format(downloads))
+  fake.stop()
+  print("{}: OK".format(os.path.relpath(service_dir, REPO_DIR)))
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument("--service-dir", help=argparse.SUPPRESS)
+  args = parser.parse_args()
+  if args.service_dir:
+    check_service(args.service_dir)
+    return
+  for service_dir in SERVICE_DIRS:
+    subprocess.run([sys.executable, os.path.abspath(__file__),
+                    "--service-dir", service_dir], check=True)
+
+
+if __name__ == "__main__":
+  main()
@@ -0,0 +1,198 @@
+#!/usr/bin/env python
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Local stand-in for Cloud Storage, to run the resume services offline.
+
+Implements the small part of the Cloud Storage JSON API used by the
+samples: reading object metadata, downloading objects and listing buckets.
+Objects are kept in memory and can be added, replaced or deleted from
+Python. Point the services to it with the STORAGE_EMULATOR_HOST variable.
+
+Usage: python fake_gcs.py [--port 4443] [--bucket NAME] FILE...
+"""
+import argparse
+import base64
+import hashlib
+import http.server
+import json
+import os
+import threading
+import time
+import urllib.parse
+
+
+class FakeGCS(object):
+  """In-memory buckets served over HTTP in a background thread."""
+
+  def __init__(self, host="127.0.0.1", port=0, latency=0):
+    self.buckets = {}
+    self.request_count = 0
+    self.download_count = 0
+    # Seconds added to every request, standing in for the network
+    self.latency = latency
+    self._lock = threading.Lock()
+    self._server = http.server.ThreadingHTTPServer(
+        (host, port), _make_handler(self))
+    self._server.daemon_threads = True
+    self._thread = None
+
+  @property
+  def url(self):
+    host, port = self._server.server_address[:2]
+    return "http://{}:{}".format(host, port)
+
+  def start(self):
+    self._thread = threading.Thread(
+        target=self._server.serve_forever, daemon=True)
+    self._thread.start()
+    return self
+
+  def stop(self):
+    self._server.shutdown()
+    self._server.server_close()
+
+  def put(self, bucket_name, object_name, data):
+    """Creates or replaces an object, giving it a new generation."""
+    with self._lock:
+      generation = time.time_ns() // 1000
+      self.buckets.setdefault(bucket_name, {})[object_name] = {
+          "data": bytes(data),
+          "generation": generation,
+          "updated": time.strftime(
+              "%Y-%m-%dT%H:%M:%S.000Z", time.gmtime()),
+      }
+      return generation
+
+  def delete(self, bucket_name, object_name):
+    with self._lock:
+      self.buckets.get(bucket_name, {}).pop(object_name, None)
+
+  def get(self, bucket_name, object_name):
+    with self._lock:
+      return self.buckets.get(bucket_name, {}).get(object_name)
+
+  def list(self, bucket_name, prefix=""):
+    with self._lock:
+      objects = self.buckets.get(bucket_name, {})
+      return sorted((name, stored) for name, stored in objects.items()
+                    if name.startswith(prefix))
+
+  def metadata(self, bucket_name, object_name, stored):
+    data = stored["data"]
+    quoted = urllib.parse.quote(object_name, safe="")
+    return {
+        "kind": "storage#object",
+        "id": "{}/{}/{}".format(bucket_name, object_name,
+                                stored["generation"]),
+        "name": object_name,
+        "bucket": bucket_name,
+        "generation": str(stored["generation"]),
+        "metageneration": "1",
+        "contentType": "text/html",
+        "size": str(len(data)),
+        "md5Hash": base64.b64encode(hashlib.md5(data).digest()).decode(),
+        "etag": "CAE=",
+        "updated": stored["updated"],
+        "timeCreated": stored["updated"],
+        "mediaLink": "{}/download/storage/v1/b/{}/o/{}?generation={}"
+                     "&alt=media".format(self.url, bucket_name, quoted,
+                                         stored["generation"]),
+    }
+
+
+def _make_handler(fake):
+
+  class Handler(http.server.BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, *args):
+      pass
+
+    def _send(self, status, body, content_type="application/json",
+              headers=()):
+      if not isinstance(body, bytes):
+        body = json.dumps(body).encode("utf-8")
+      self.send_response(status)
+      self.send_header("Content-Type", content_type)
+      self.send_header("Content-Length", str(len(body)))
+      for name, value in headers:
+        self.send_header(name, value)
+      self.end_headers()
+      self.wfile.write(body)
+
+    def _not_found(self):
+      self._send(404, {"error": {"code": 404, "message": "Not Found"}})
+
+    def do_GET(self):
+      with fake._lock:
+        fake.request_count += 1
+      if fake.latency:
+        time.sleep(fake.latency)
+      url = urllib.parse.urlsplit(self.path)
+      params = dict(urllib.parse.parse_qsl(url.query))
+      path = url.path
+      if path.startswith("/download"):
+        path = path[len("/download"):]
+      parts = path.split("/")
+      # /storage/v1/b/<bucket>/o[/<object>]
+      if len(parts) < 6 or parts[1:4] != ["storage", "v1", "b"]:
+        return self._not_found()
+      bucket_name = urllib.parse.unquote(parts[4])
+      if parts[5] != "o":
+        return self._not_found()
+      if len(parts) == 6:
+        prefix = params.get("prefix", "")
+        items = [fake.metadata(bucket_name, name, stored)
+                 for name, stored in fake.list(bucket_name, prefix)]
+        return self._send(200, {"kind": "storage#objects", "items": items})
+
+      object_name = urllib.parse.unquote("/".join(parts[6:]))
+      stored = fake.get(bucket_name, object_name)
+      if stored is None:
+        return self._not_found()
+      for param in ("generation", "ifGenerationMatch"):
+        if param in params and int(params[param]) != stored["generation"]:
+          status = 404 if param == "generation" else 412
+          return self._send(status, {"error": {"code": status}})
+      if params.get("alt") == "media":
+        with fake._lock:
+          fake.download_count += 1
+        md5 = fake.metadata(bucket_name, object_name, stored)["md5Hash"]
+        return self._send(
+            200, stored["data"], "text/html",
+            [("x-goog-hash", "md5=" + md5),
+             ("x-goog-generation", str(stored["generation"]))])
+      return self._send(200, fake.metadata(bucket_name, object_name, stored))
+
+  return Handler
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument("--host", default="127.0.0.1")
+  parser.add_argument("--port", type=int, default=4443)
+  parser.add_argument("--bucket", default="resume_xew878w6e")
+  parser.add_argument("files", nargs="*")
+  args = parser.parse_args()
+  fake = FakeGCS(args.host, args.port)
+  for path in args.files:
+    with open(path, "rb") as source:
+      fake.put(args.bucket, os.path.basename(path), source.read())
+  print("Serving fake GCS at {}, export STORAGE_EMULATOR_HOST={}".format(
+      fake.url, fake.url))
+  fake._server.serve_forever()
+
+
+if __name__ == "__main__":
+  main()
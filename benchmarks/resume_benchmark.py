@@ -0,0 +1,235 @@
+#!/usr/bin/env python
+# Copyright 2023 Google LLC
+#
+# Licensed under the Apache License, Version 2.0 (the "License");
+# you may not use this file except in compliance with the License.
+# You may obtain a copy of the License at
+#
+#     https://www.apache.org/licenses/LICENSE-2.0
+#
+# Unless required by applicable law or agreed to in writing, software
+# distributed under the License is distributed on an "AS IS" BASIS,
+# WITHOUT WARRANTIES OR CONDITIONS OF ANY KIND, either express or implied.
+# See the License for the specific language governing permissions and
+# limitations under the License.
+"""Offline benchmark of the resume services.
+
+Drives the get() view of Chapter04/app_engine/main.py and Chapter05/main.py
+at fixed concurrency levels, and reports throughput, latency percentiles
+and the memory and blocks allocated per request, from tracemalloc
+snapshots taken before and after a number of requests. The Chapter04
+service reads its templates from a local fake GCS loaded with the
+repository's english.html, so no bucket or credentials are needed.
+
+Each service runs in its own process, as both are named main. Results are
+written as JSON, and can be compared with those of a previous run:
+
+  python resume_benchmark.py --output before.json
+  python resume_benchmark.py --output after.json --baseline before.json
+"""
+import argparse
+import concurrent.futures
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+import tracemalloc
+
+from fake_gcs import FakeGCS
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+TARGETS = {
+    "chapter04": os.path.join(REPO_DIR, "Chapter04", "app_engine"),
+    "chapter05": os.path.join(REPO_DIR, "Chapter05"),
+}
+TEMPLATE_FILE = os.path.join(
+    REPO_DIR, "Chapter04", "cloud_function", "cloud_storage", "english.html")
+BUCKET_NAME = "resume_xew878w6e"
+
+
+def load_app(target):
+  """Imports the Flask app of a target, with its templates ready."""
+  if target == "chapter04":
+    fake = FakeGCS().start()
+    with open(TEMPLATE_FILE, "rb") as template_file:
+      fake.put(BUCKET_NAME, "english.html", template_file.read())
+    os.environ["STORAGE_EMULATOR_HOST"] = fake.url
+    os.environ["CLOUD_LOGGING"] = "false"
+    # Timings are still measured, but not printed for each request
+    os.environ["LOG_REQUEST_TIMINGS"] = "false"
+  os.chdir(TARGETS[target])
+  sys.path.insert(0, TARGETS[target])
+  import main
+  return main.app
+
+
+def request_paths(count, recipients):
+  """Returns the paths requested, cycling over a number of recipients."""
+  return ["/?name=Person+{0}&company=Company+{0}".format(index % recipients)
+          for index in range(count)]
+
+
+def run_level(app, paths, concurrency):
+  """Sends all the requests with a number of concurrent clients."""
+  local = threading.local()
+
+  def send(path):
+    if not hasattr(local, "client"):
+      local.client = app.test_client()
+    start = time.perf_counter()
+    response = local.client.get(path)
+    response.get_data()
+    return time.perf_counter() - start, response.status_code
+
+  start = time.perf_counter()
+  with concurrent.futures.ThreadPoolExecutor(concurrency) as executor:
+    results = list(executor.map(send, paths))
+  elapsed = time.perf_counter() - start
+
+  latencies = sorted(latency for latency, _ in results)
+  quantiles = statistics.quantiles(latencies, n=100)
+  return {
+      "concurrency": concurrency,
+      "requests": len(paths),
+      "errors": sum(1 for _, status in results if status != 200),
+      "throughput_rps": len(paths) / elapsed,
+      "latency_ms": {
+          "p50": quantiles[49] * 1000,
+          "p95": quantiles[94] * 1000,
+          "p99": quantiles[98] * 1000,
+      },
+  }
+
+
+def measure_allocations(app, paths):
+  """Returns the memory and blocks allocated per request.
+  Compares tracemalloc snapshots taken before and after all the requests,
+  so only the allocations still held after them are counted.
+  """
+  client = app.test_client()
+  # Leave out the memory used by tracemalloc itself
+  filters = [tracemalloc.Filter(False, tracemalloc.__file__)]
+  tracemalloc.start()
+  try:
+    before = tracemalloc.take_snapshot().filter_traces(filters)
+    for path in paths:
+      client.get(path).get_data()
+    after = tracemalloc.take_snapshot().filter_traces(filters)
+  finally:
+    tracemalloc.stop()
+  stats = after.compare_to(before, "filename")
+  return (sum(stat.size_diff for stat in stats) / len(paths),
+          sum(stat.count_diff for stat in stats) / len(paths))
+
+
+def run_worker(args):
+  app = load_app(args.worker)
+  paths = request_paths(args.requests, args.recipients)
+  results = []
+  # Chapter05 prints every request, keep that out of the measurements
+  with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+    run_level(app, paths[:50], 1)
+    for concurrency in args.concurrency:
+      results.append(run_level(app, paths, concurrency))
+    allocated, blocks = measure_allocations(app, paths[:args.alloc_requests])
+  for result in results:
+    result["alloc_bytes_per_request"] = allocated
+    result["alloc_blocks_per_request"] = blocks
+  with open(args.result_file, "w") as result_file:
+    json.dump(results, result_file)
+
+
+def compare(results, baseline, max_regression):
+  """Prints the change against a baseline, returns False on regressions."""
+  previous = {(run["target"], run["concurrency"]): run
+              for run in baseline["results"]}
+  passed = True
+  print("\n{:<10} {:>5} {:>14} {:>14}".format(
+      "target", "conc", "throughput", "p95 latency"))
+  for run in results:
+    before = previous.get((run["target"], run["concurrency"]))
+    if before is None:
+      continue
+    throughput = run["throughput_rps"] / before["throughput_rps"] - 1
+    p95 = run["latency_ms"]["p95"] / before["latency_ms"]["p95"] - 1
+    regressed = throughput < -max_regression
+    passed = passed and not regressed
+    print("{:<10} {:>5} {:>+13.1%} {:>+13.1%}{}".format(
+        run["target"], run["concurrency"], throughput, p95,
+        "  REGRESSION" if regressed else ""))
+  return passed
+
+
+def main():
+  parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+  parser.add_argument("--targets", default="chapter04,chapter05")
+  parser.add_argument("--concurrency", default="1,8,32",
+                      type=lambda value: [int(v) for v in value.split(",")])
+  parser.add_argument("--requests", type=int, default=2000,
+                      help="Requests sent at each concurrency level")
+  parser.add_argument("--recipients", type=int, default=20,
+                      help="Distinct (name, company) pairs requested")
+  parser.add_argument("--alloc-requests", type=int, default=200)
+  parser.add_argument("--output", default="resume_benchmark.json")
+  parser.add_argument("--baseline", help="Results of a previous run")
+  parser.add_argument("--max-regression", type=float, default=0.10,
+                      help="Largest throughput drop accepted")
+  parser.add_argument("--worker", choices=sorted(TARGETS),
+                      help=argparse.SUPPRESS)
+  parser.add_argument("--result-file", help=argparse.SUPPRESS)
+  args = parser.parse_args()
+  if args.worker:
+    run_worker(args)
+    return
+
+  results = []
+  for target in args.targets.split(","):
+    with tempfile.NamedTemporaryFile(suffix=".json") as result_file:
+      subprocess.run(
+          [sys.executable, os.path.abspath(__file__), "--worker", target,
+           "--result-file", result_file.name,
+           "--concurrency", ",".join(str(c) for c in args.concurrency),
+           "--requests", str(args.requests),
+           "--recipients", str(args.recipients),
+           "--alloc-requests", str(args.alloc_requests)],
+          check=True, cwd=os.path.dirname(os.path.abspath(__file__)))
+      for run in json.load(result_file):
+        results.append(dict(run, target=target))
+
+  print("{:<10} {:>5} {:>10} {:>9} {:>9} {:>9} {:>12} {:>12}".format(
+      "target", "conc", "req/s", "p50 ms", "p95 ms", "p99 ms", "alloc KiB",
+      "alloc blocks"))
+  for run in results:
+    print("{:<10} {:>5} {:>10.1f} {:>9.2f} {:>9.2f} {:>9.2f} {:>12.2f} "
+          "{:>12.1f}".format(
+              run["target"], run["concurrency"], run["throughput_rps"],
+              run["latency_ms"]["p50"], run["latency_ms"]["p95"],
+              run["latency_ms"]["p99"], run["alloc_bytes_per_request"] / 1024,
+              run["alloc_blocks_per_request"]))
+
+  with open(args.output, "w") as output:
+    json.dump({
+        "timestamp": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+        "python": platform.python_version(),
+        "settings": {
+            "requests": args.requests,
+            "recipients": args.recipients,
+        },
+        "results": results,
+    }, output, indent=2)
+
+  if args.baseline:
+    with open(args.baseline) as baseline_file:
+      baseline = json.load(baseline_file)
+    if not compare(results, baseline, args.max_regression):
+      sys.exit(1)
+
+
+if __name__ == "__main__":
+  main()